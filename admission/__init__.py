@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+
+
+class AdmissionError(Exception):
+    pass
+
+class TokenBucket:
+    """ Allows bursts of up to `burst` uses, refilled at `rate` uses per second. """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """ Seconds until a token is available, 0 if one is available now. """
+        self.refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def take(self):
+        """ Take a token if one is available, otherwise return the seconds until one will be. """
+        retry = self.wait_time()
+        if not retry:
+            self.tokens -= 1
+        return retry
+
+    @property
+    def full(self):
+        self.refill()
+        return self.tokens >= self.burst
+
+class Ticket:
+    def __init__(self, command, user_id, guild_id):
+        self.command = command
+        self.user_id = user_id
+        self.guild_id = guild_id
+
+class AdmissionStats:
+    """ Admission counters and queue wait times per command, for monitoring. """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.data = {}
+
+    def _entry(self, command):
+        return self.data.setdefault(command, dict(admitted=0, rate_limited=0, busy=0, wait_total=0.0, wait_max=0.0))
+
+    def admitted(self, command, wait):
+        with self._lock:
+            entry = self._entry(command)
+            entry['admitted'] += 1
+            entry['wait_total'] += wait
+            entry['wait_max'] = max(entry['wait_max'], wait)
+
+    def rejected(self, command, reason):
+        with self._lock:
+            self._entry(command)[reason] += 1
+
+    def __str__(self):
+        with self._lock:
+            if not self.data:
+                return 'No limited commands used yet.'
+            lines = []
+            for command, entry in sorted(self.data.items()):
+                lines.append('{}: {} admitted, {} rate limited, {} busy, {:.1f} ms avg wait, {:.1f} ms max wait'.format(
+                    command, entry['admitted'], entry['rate_limited'], entry['busy'],
+                    entry['wait_total'] / entry['admitted'] * 1000 if entry['admitted'] else 0,
+                    entry['wait_max'] * 1000
+                ))
+            return '\n'.join(lines)
+
+class AdmissionController:
+    """
+    Limits expensive commands across all cogs. Each configured command has a per-user token
+    bucket rate limit, and all configured commands share global, per-user and per-guild
+    concurrency limits. A command that can't run immediately waits up to cfg.admission.max_wait
+    seconds for a slot, or is rejected straight away if max_wait is 0. Commands defer after being
+    admitted, so waits are capped at MAX_WAIT to stay under Discord's 3 second interaction deadline.
+
+    Limits are read from the config on every use so that they can be changed at runtime.
+    """
+    # Number of idle buckets kept before full ones are pruned
+    MAX_IDLE_BUCKETS = 1000
+    # Longest wait for a slot in seconds, leaving time to defer before the interaction expires
+    MAX_WAIT = 2
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.stats = AdmissionStats()
+        self.active = 0
+        self.active_users = Counter()
+        self.active_guilds = Counter()
+        self.buckets = {}
+        self._cond = None
+
+    @property
+    def _condition(self):
+        # Created lazily so that it's bound to the running event loop
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def limits(self, command):
+        cfg = self.cfg.get('admission')
+        if not cfg or not cfg.enabled:
+            return None
+        return cfg.commands.get(command)
+
+    def _bucket(self, command, user_id, limits):
+        key = (command, user_id)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.MAX_IDLE_BUCKETS:
+                self.buckets = {k: b for k, b in self.buckets.items() if not b.full}
+            bucket = self.buckets[key] = TokenBucket(limits.rate, limits.burst)
+        bucket.rate, bucket.burst = limits.rate, limits.burst
+        return bucket
+
+    def _has_slot(self, user_id, guild_id):
+        cfg = self.cfg.admission
+        return (self.active < cfg.global_limit
+                and self.active_users[user_id] < cfg.user_limit
+                and (guild_id is None or self.active_guilds[guild_id] < cfg.guild_limit))
+
+    async def acquire(self, command, user_id, guild_id):
+        """ Admit a command, or raise AdmissionError. Returns a ticket to release, or None if the command isn't limited. """
+        limits = self.limits(command)
+        if limits is None:
+            return None
+
+        # Check the rate limit up front, but only take a token once a slot is granted so that
+        # requests rejected as busy don't use up the user's rate limit
+        bucket = self._bucket(command, user_id, limits)
+        self._check_rate(command, bucket.wait_time())
+
+        start = time.monotonic()
+        cond = self._condition
+        async with cond:
+            if not self._has_slot(user_id, guild_id):
+                try:
+                    await asyncio.wait_for(
+                        cond.wait_for(lambda: self._has_slot(user_id, guild_id)),
+                        min(self.cfg.admission.max_wait, self.MAX_WAIT)
+                    )
+                except asyncio.TimeoutError:
+                    self.stats.rejected(command, 'busy')
+                    raise AdmissionError('Too many requests are running right now. Try again in a moment.')
+
+            # Another request from the same user may have taken the token while this one waited
+            self._check_rate(command, bucket.take())
+            self.active += 1
+            self.active_users[user_id] += 1
+            if guild_id is not None:
+                self.active_guilds[guild_id] += 1
+
+        self.stats.admitted(command, time.monotonic() - start)
+        return Ticket(command, user_id, guild_id)
+
+    def _check_rate(self, command, retry):
+        if retry:
+            self.stats.rejected(command, 'rate_limited')
+            raise AdmissionError('You are using /{} too often. Try again in {:.1f}s.'.format(command, retry))
+
+    async def release(self, ticket):
+        cond = self._condition
+        async with cond:
+            self.active -= 1
+            self.active_users[ticket.user_id] -= 1
+            if not self.active_users[ticket.user_id]:
+                del self.active_users[ticket.user_id]
+            if ticket.guild_id is not None:
+                self.active_guilds[ticket.guild_id] -= 1
+                if not self.active_guilds[ticket.guild_id]:
+                    del self.active_guilds[ticket.guild_id]
+            cond.notify_all()
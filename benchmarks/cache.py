@@ -0,0 +1,100 @@
+""" Benchmark the memory used by each cache policy on a synthetic large guild. Run with python -m benchmarks.cache """
+import asyncio
+import gc
+import tracemalloc
+
+from discord import Intents
+from discord.state import ChunkRequest, ConnectionState
+
+from blurbot import cache_options
+from util import Config
+
+GUILD_ID = 1
+CHANNEL_ID = 2
+POLICIES = {
+    'default': {},
+    'voice+joined': {'member_flags': ['voice', 'joined']},
+    'voice only': {'member_flags': ['voice']},
+    'no message cache': {'member_flags': ['voice', 'joined'], 'max_messages': 0},
+    'lazy chunking': {'member_flags': ['voice', 'joined'], 'max_messages': 0, 'chunk_guilds_at_startup': False},
+}
+
+
+def user(i):
+    return {'id': str(1000 + i), 'username': 'user{}'.format(i), 'discriminator': '0', 'global_name': 'User {}'.format(i),
+            'avatar': None}
+
+def member(i):
+    return {'user': user(i), 'roles': [], 'joined_at': '2020-01-01T00:00:00+00:00', 'deaf': False, 'mute': False,
+            'nick': None}
+
+def guild_payload(members, voice):
+    """ A large guild as sent on GUILD_CREATE: only members in voice channels (and a few others) are included. """
+    return {
+        'id': str(GUILD_ID), 'name': 'Large guild', 'owner_id': str(1000), 'large': True, 'member_count': members,
+        'roles': [{'id': str(GUILD_ID), 'name': '@everyone', 'permissions': '0', 'position': 0, 'color': 0, 'colors': {'primary_color': 0},
+                   'hoist': False, 'managed': False, 'mentionable': False}],
+        'channels': [{'id': str(CHANNEL_ID), 'type': 0, 'name': 'general', 'position': 0, 'permission_overwrites': []},
+                     {'id': str(CHANNEL_ID + 1), 'type': 2, 'name': 'voice', 'position': 1, 'permission_overwrites': []}],
+        'members': [member(i) for i in range(voice)],
+        'voice_states': [{'user_id': str(1000 + i), 'channel_id': str(CHANNEL_ID + 1), 'session_id': 'x', 'deaf': False,
+                          'mute': False, 'self_deaf': False, 'self_mute': False, 'suppress': False} for i in range(voice)],
+        'presences': [], 'emojis': [], 'stickers': [], 'threads': [], 'stage_instances': [], 'features': [],
+    }
+
+def message_payload(i, members):
+    author = i * 7919 % members
+    return {'id': str(10 ** 6 + i), 'channel_id': str(CHANNEL_ID), 'guild_id': str(GUILD_ID), 'author': user(author),
+            'member': {key: value for key, value in member(author).items() if key != 'user'},
+            'content': 'message number {} with some text in it'.format(i), 'timestamp': '2020-01-01T00:00:00+00:00',
+            'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [],
+            'attachments': [], 'embeds': [], 'pinned': False, 'type': 0}
+
+
+async def measure(options, members, voice, messages):
+    """ Bytes held by the client's caches after receiving the guild, its member chunks and messages, and cache sizes. """
+    intents = Intents.default()
+    intents.members = True
+    intents.message_content = True
+    state = ConnectionState(dispatch=lambda *args, **kwargs: None, handlers={}, hooks={}, http=None,
+                            loop=asyncio.get_running_loop(), intents=intents, **options)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    guild = state._get_create_guild(guild_payload(members, voice))
+    state._add_guild(guild)
+    if state._guild_needs_chunking(guild):
+        # What the gateway sends back when the guild is chunked at startup, in chunks of 1000 members
+        state._chunk_requests[GUILD_ID] = ChunkRequest(GUILD_ID, state.loop, state._get_guild,
+                                                       cache=state.member_cache_flags.joined)
+        nonce = state._chunk_requests[GUILD_ID].nonce
+        for start in range(0, members, 1000):
+            state.parse_guild_members_chunk({'guild_id': str(GUILD_ID), 'nonce': nonce,
+                                             'chunk_index': start // 1000,
+                                             'chunk_count': -(-members // 1000),
+                                             'members': [member(i) for i in range(start, min(start + 1000, members))]})
+    for i in range(messages):
+        state.parse_message_create(message_payload(i, members))
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used, len(guild._members), len(state._users), len(state._messages or ())
+
+
+async def run(members=50000, voice=100, messages=5000):
+    # Warm up so that lazily imported modules and interned strings aren't counted against the first policy
+    await measure({}, 100, 10, 10)
+    print('{} members, {} in voice, {} messages'.format(members, voice, messages))
+    print('{:<18} {:>10} {:>10} {:>10} {:>10}'.format('policy', 'memory', 'members', 'users', 'messages'))
+    for name, cfg in POLICIES.items():
+        used, *counts = await measure(cache_options(Config(loads=cfg)), members, voice, messages)
+        print('{:<18} {:>7.1f} MB {:>10} {:>10} {:>10}'.format(name, used / 2 ** 20, *counts))
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
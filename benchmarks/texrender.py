@@ -0,0 +1,53 @@
+""" Benchmark LaTeX renders per second. Run with python -m benchmarks.texrender """
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import texrender
+
+EXPRESSIONS = [r'x^{2}', r'\frac{a}{b}', r'\int_{0}^{1} x \, dx', r'\sum_{n=1}^{\infty} \frac{1}{n^{2}}',
+               r'\sqrt{x^{2}+y^{2}}', r'\begin{pmatrix} 1 & 0 \\ 0 & 1 \end{pmatrix}']
+
+
+def cold_render(tex, dpi=200):
+    """ Previous approach: a new pdflatex process loading the whole preamble for every render. """
+    workdir = tempfile.mkdtemp(prefix='blurbot-tex-bench-')
+    try:
+        with open(os.path.join(workdir, 'doc.tex'), 'w') as f:
+            f.write(texrender.PREAMBLE + texrender.DOCUMENT % ('white', tex))
+        subprocess.run(['pdflatex', '-interaction=nonstopmode', '-halt-on-error', '-jobname=doc', 'doc.tex'],
+                       cwd=workdir, stdout=subprocess.DEVNULL, check=True)
+        subprocess.run(['pdftocairo', '-png', '-singlefile', '-transp', '-r', str(dpi), 'doc.pdf', 'doc'],
+                       cwd=workdir, stdout=subprocess.DEVNULL, check=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def rate(render, n, threads=1):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(render, (EXPRESSIONS[i % len(EXPRESSIONS)] for i in range(n))))
+    return n / (time.perf_counter() - start)
+
+
+def main(n=30):
+    if not (shutil.which('pdflatex') and shutil.which('pdftocairo')):
+        sys.exit('pdflatex and pdftocairo are required for this benchmark.')
+
+    start = time.perf_counter()
+    renderer = texrender.TexRenderer(workers=4)
+    print('Format build: {:.0f} ms'.format((time.perf_counter() - start) * 1000))
+    try:
+        print('Cold pdflatex:         {:6.1f} renders/s'.format(rate(cold_render, n)))
+        print('Renderer, 1 thread:    {:6.1f} renders/s'.format(rate(renderer.render, n)))
+        print('Renderer, 4 threads:   {:6.1f} renders/s'.format(rate(renderer.render, n, threads=4)))
+    finally:
+        renderer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+""" Benchmark text transforms against the previous implementations. Run with python -m benchmarks.textfx """
+import random
+import timeit
+
+import textfx
+
+OLD_SUBSTITUTION = {'r': 'w', 'l': 'w', 'R': 'W', 'L': 'W', 'no': 'nu', 'has': 'haz',
+                    'have': 'haz', 'you': 'uu', ' the ': ' da ', 'The ': ' Da '}
+
+
+def old_substitute(content):
+    for key, replacement in OLD_SUBSTITUTION.items():
+        content = content.replace(key, replacement)
+    return content
+
+def old_spongemock(text):
+    content = ''
+    for letter in text:
+        if random.random() > 0.5:
+            content += letter.upper()
+        else:
+            content += letter.lower()
+    return content
+
+
+def main(number=200):
+    words = 'hello there you have no real love for the rolling hills'.split()
+    print('{:>6} {:>12} {:>12} {:>12} {:>12}'.format('chars', 'owo old', 'owo new', 'sponge old', 'sponge new'))
+    for length in (10, 30, 100, 500, 1000, 2000, 4000):
+        text = ' '.join(random.choice(words) for _ in range(length))[:length]
+        times = [
+            timeit.timeit(lambda: old_substitute(text), number=number),
+            timeit.timeit(lambda: textfx.owo(text), number=number),
+            timeit.timeit(lambda: old_spongemock(text), number=number),
+            timeit.timeit(lambda: textfx.spongemock(text), number=number),
+        ]
+        print('{:>6} {}'.format(length, ' '.join('{:>9.1f} us'.format(t / number * 1e6) for t in times)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,31 @@
+import asyncio
 import os
 import random
-import re
 import sys
 import traceback
 
 from discord import ApplicationContext as AppCtx, Message
-from discord import Intents
-from discord.ext.commands import Bot
+from discord import Intents, MemberCacheFlags
+from discord.ext.commands import Bot, AutoShardedBot
 
 import cogs
-from util import Config, render_egg, get_presence, create_storage
+import sharding
+from admission import AdmissionController
+from util import Config, compile_eggs, get_presence, create_storage
 
 
-class Blurbot(Bot):
-    def __init__(self):
+class BlurbotMixin:
+    """
+    Blurbot's behaviour, shared by the single process bot and the sharded bot. When sharded,
+    `ipc` connects the process to the launcher, which relays config reloads between shard
+    groups and collects their health.
+    """
+    def __init__(self, ipc=None, **options):
+        self.ipc = ipc
         self.cfg = Config(create_storage('config'))
         print('Config loaded using {}'.format(self.cfg.storage))
+        self.load_eggs()
+        self.admission = AdmissionController(self.cfg)
 
         intents = Intents.default()
         intents.members = True
@@ -24,15 +34,66 @@ class Blurbot(Bot):
         super().__init__(
             intents=intents,
             owner_ids=self.cfg.admins,
-            debug_guilds=self.cfg.guilds
+            debug_guilds=self.cfg.guilds,
+            **cache_options(self.cfg.get('cache')),
+            **options
         )
+        self.before_invoke(self.admit)
+        self.after_invoke(self.release)
         cogs.setup(self)
 
+    def load_eggs(self):
+        self.eggs = compile_eggs(self.cfg.eggs.data)
+
+    @property
+    def is_primary(self):
+        """ Whether this process runs bot-wide tasks. Only the process with shard 0 does when sharded. """
+        shard_ids = getattr(self, 'shard_ids', None)
+        return not shard_ids or 0 in shard_ids
+
+    def config_changed(self):
+        """ Tell the other shard groups to reload the config after it was saved. """
+        if self.ipc is not None:
+            self.ipc.send('broadcast', event='config_reload')
+
+    def on_ipc_message(self, msg):
+        if msg['op'] == 'broadcast' and msg['event'] == 'config_reload':
+            self.cfg.reload()
+            self.load_eggs()
+            self.dispatch('config_reload')
+        elif msg['op'] == 'shutdown':
+            self.loop.create_task(self.close())
+
+    async def report_health(self):
+        while not self.is_closed():
+            self.ipc.send('health', shards={
+                shard_id: dict(latency=shard.latency, closed=shard.is_closed())
+                for shard_id, shard in self.shards.items()
+            })
+            await asyncio.sleep((self.cfg.get('sharding') or {}).get('health_interval', 30))
+
+    async def shard_status(self):
+        """ Health of every shard group, from the launcher. """
+        return (await self.ipc.request('status'))['groups']
+
+    async def admit(self, ctx:AppCtx):
+        ctx.admission_ticket = await self.admission.acquire(
+            ctx.command.qualified_name, ctx.author.id, ctx.guild_id
+        )
+
+    async def release(self, ctx:AppCtx):
+        ticket = getattr(ctx, 'admission_ticket', None)
+        if ticket is not None:
+            await self.admission.release(ticket)
+
     async def on_ready(self):
         print("\nLogged in as {}".format(self.user))
+        if self.ipc is not None and self.ipc.loop is None:
+            self.ipc.start(self.loop, self.on_ipc_message)
+            self.loop.create_task(self.report_health())
         if self.cfg.presences.enabled:
             activity = get_presence(random.choice(self.cfg.presences.data))
-            await blurbot.change_presence(activity=activity)
+            await self.change_presence(activity=activity)
 
     async def on_message(self, msg:Message):
         if msg.author.bot:
@@ -41,13 +102,18 @@ class Blurbot(Bot):
         # Chance presences
         if self.cfg.presences.enabled and random.random() < self.cfg.presences.change_chance:
             activity = get_presence(random.choice(self.cfg.presences.data))
-            await blurbot.change_presence(activity=activity)
+            await self.change_presence(activity=activity)
 
         # Eggs
         if self.cfg.eggs.enabled:
-            for egg in self.cfg.eggs.data:
-                if re.fullmatch(egg.regex, msg.content):
-                    await msg.reply(render_egg(random.choice(egg.responses), msg), mention_author=False)
+            for egg in self.eggs:
+                if egg.regex.fullmatch(msg.content):
+                    response = random.choice(egg.responses)
+                    if response.is_eval:
+                        text = response.render(msg, self.cfg.eggs.get('timeout', 1))
+                    else:
+                        text = response.source
+                    await msg.reply(text, mention_author=False)
                     break
 
         # Reactions
@@ -73,6 +139,48 @@ class Blurbot(Bot):
                                   exception.__traceback__, file=sys.stderr)
 
 
+class Blurbot(BlurbotMixin, Bot):
+    pass
+
+class ShardedBlurbot(BlurbotMixin, AutoShardedBot):
+    pass
+
+
+def cache_options(cfg):
+    """
+    Client cache options from the config. Only the message being handled is needed by on_message
+    and only members in voice channels are needed for voice checks, so the member and message
+    caches can be trimmed down to save memory in large guilds.
+    """
+    if not cfg:
+        return {}
+
+    options = {}
+    if 'member_flags' in cfg:
+        if cfg.member_flags == 'all':
+            flags = MemberCacheFlags.all()
+        else:
+            flags = MemberCacheFlags.none()
+            for flag in cfg.member_flags:
+                if flag not in MemberCacheFlags.VALID_FLAGS:
+                    raise ValueError('Unknown member cache flag {!r} in cache.member_flags, expected one of: {}'
+                                     .format(flag, ', '.join(MemberCacheFlags.VALID_FLAGS)))
+                setattr(flags, flag, True)
+        options['member_cache_flags'] = flags
+    if 'max_messages' in cfg:
+        # 0 or None disables the message cache
+        options['max_messages'] = cfg.max_messages or None
+    if 'chunk_guilds_at_startup' in cfg:
+        options['chunk_guilds_at_startup'] = cfg.chunk_guilds_at_startup
+    return options
+
+
 if __name__ == '__main__':
-    blurbot = Blurbot()
-    blurbot.run(os.environ['BLURBOT_SECRET'])
+    shards = os.environ.get('BLURBOT_SHARDS')
+    if shards:
+        # BLURBOT_SHARDS=<shard count>:<processes>
+        shard_count, processes = map(int, shards.split(':'))
+        sharding.Launcher(os.environ['BLURBOT_SECRET'], shard_count, processes).run()
+    else:
+        blurbot = Blurbot()
+        blurbot.run(os.environ['BLURBOT_SECRET'])
@@ -1,22 +1,32 @@
 import asyncio
+import heapq
 import random
 import sys
+import threading
+import time
 import traceback
 from io import BytesIO
 
 import calc
 import requests
 import stopit
-from discord import ApplicationContext as AppCtx, Message, Member, VoiceChannel, ButtonStyle, Interaction, \
+from discord import ApplicationContext as AppCtx, Message, Member, VoiceChannel, TextChannel, ButtonStyle, Interaction, \
     VoiceClient, VoiceState, File, ActivityType, Activity, Status, default_permissions, Permissions, option
 from discord.commands import slash_command, SlashCommandGroup, message_command, user_command
 from discord.ext.commands import Cog
 from discord.ui import Button, View
 from discord.utils import get
 
+import dice
 import garfield
+import graphing
+import imaging
+import profiling
+import texrender
+import textfx
 import tictactoe
-from util import create_storage, VoiceError
+from mathctx import ContextCache, MathContext
+from util import Config, ConfigList, VoiceError
 from youtube import TYDLSource, duration_string
 
 
@@ -50,6 +60,9 @@ class Admin(Cog):
         """ Kill the bot. """
         print('Killing...\n')
         await ctx.respond('Goodnight... 😴💤')
+        if self.bot.ipc is not None:
+            # Shut down every shard group, not just this one
+            self.bot.ipc.send('shutdown')
         await self.bot.close()
 
     cfg = SlashCommandGroup(
@@ -76,14 +89,84 @@ class Admin(Cog):
         val = self.bot.cfg.infer_type(val)
         self.bot.cfg[key] = val
         self.bot.cfg.save()
+        self.bot.load_eggs()
+        self.bot.config_changed()
+        self.bot.dispatch('config_reload')
         await ctx.respond('Key: `{}`\nType: `{}` ```{}```'.format(key, type(val), val))
 
     @cfg.command(name='reload')
     async def cfg_reload(self, ctx:AppCtx):
         """ Reload the configuration from the file. """
         self.bot.cfg.reload()
+        self.bot.load_eggs()
+        self.bot.config_changed()
+        self.bot.dispatch('config_reload')
         await ctx.respond('Config reloaded from `{}`'.format(self.bot.cfg.fp))
 
+    @slash_command(name='imagestats')
+    @default_permissions(administrator=True)
+    async def imagestats(self, ctx:AppCtx):
+        """ Show image encoding statistics. """
+        await ctx.respond('```{}```'.format(imaging.stats), ephemeral=True)
+
+    @slash_command(name='admission')
+    @default_permissions(administrator=True)
+    async def admission(self, ctx:AppCtx):
+        """ Show admission control statistics for limited commands. """
+        await ctx.respond('Running: {}```{}```'.format(self.bot.admission.active, self.bot.admission.stats), ephemeral=True)
+
+    @slash_command(name='shards')
+    @default_permissions(administrator=True)
+    async def shards(self, ctx:AppCtx):
+        """ Show the health and latency of each shard. """
+        if self.bot.ipc is None:
+            await ctx.respond('Not sharded. Latency: {:.0f} ms'.format(self.bot.latency * 1000), ephemeral=True)
+            return
+
+        lines = []
+        for group in await self.bot.shard_status():
+            health = group['health']
+            lines.append('Group {} ({}, {} restarts)'.format(
+                group['group'], 'alive' if group['alive'] else 'down', group['restarts']))
+            for shard_id in group['shard_ids']:
+                shard = health and health['shards'].get(shard_id)
+                if shard is None:
+                    lines.append('  Shard {}: no report'.format(shard_id))
+                else:
+                    lines.append('  Shard {}: {}, {:.0f} ms ({:.0f}s ago)'.format(
+                        shard_id, 'closed' if shard['closed'] else 'open',
+                        shard['latency'] * 1000, time.time() - health['time']))
+        await ctx.respond('```{}```'.format('\n'.join(lines)), ephemeral=True)
+
+    profile = SlashCommandGroup(
+        'profile',
+        'profile the running bot',
+        default_member_permissions=Permissions(administrator=True)
+    )
+
+    @profile.command(name='cpu')
+    @option('seconds', float, description='Enter capture duration in seconds', required=False, default=30)
+    async def profile_cpu(self, ctx:AppCtx, seconds):
+        """ Capture a cProfile and stack samples of the running bot. """
+        await self.run_profile(ctx, profiling.profile_cpu, seconds)
+
+    @profile.command(name='mem')
+    @option('seconds', float, description='Enter capture duration in seconds', required=False, default=30)
+    async def profile_mem(self, ctx:AppCtx, seconds):
+        """ Capture memory allocations of the running bot with tracemalloc. """
+        await self.run_profile(ctx, profiling.profile_mem, seconds)
+
+    async def run_profile(self, ctx:AppCtx, capture, seconds):
+        if not 0 < seconds <= self.bot.cfg.profile.max_seconds:
+            raise ValueError('Capture duration must be between 0 and {} seconds'.format(self.bot.cfg.profile.max_seconds))
+        await ctx.defer(ephemeral=True)
+        files = await capture(seconds, top=self.bot.cfg.profile.top)
+        await ctx.respond(
+            'Captured {:g}s profile.'.format(seconds),
+            files=[File(BytesIO(data), filename) for filename, data in files.items()],
+            ephemeral=True
+        )
+
     @slash_command(name='presence')
     @default_permissions(administrator=True)
     @option(
@@ -106,6 +189,7 @@ class Admin(Cog):
 class Misc(Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.transforms = textfx.load_transforms(self.bot.cfg.misc.get('transforms'))
 
     @message_command(name='OwOify')
     async def owo(self, ctx:AppCtx, msg:Message):
@@ -113,19 +197,7 @@ class Misc(Cog):
         if msg.author.bot:
             raise PermissionError('Cannot use message commands on bots.')
 
-        substitution = {'r': 'w', 'l': 'w', 'R': 'W', 'L': 'W', 'no': 'nu', 'has': 'haz',
-                        'have': 'haz', 'you': 'uu', ' the ': ' da ', 'The ': ' Da '}
-        prefixes = ['<3', 'H-hewwo??', 'HIIII!', 'Haiiii!', 'Huohhhh.', 'OWO', 'OwO', 'UwU',
-                    '88w88', 'H-h-hi']
-        suffixes = [':3', 'UwU', 'ʕʘ‿ʘʔ', '>_>', '^_^', '.', 'Huoh.', '^-^', ';_;', 'xD',
-                    'x3', ':D', ':P', ';3', 'XDDD', 'fwendo', 'ㅇㅅㅇ', '(人◕ω◕)', '（＾ｖ＾）',
-                    'Sigh.', '._.', '>_<' 'xD xD xD', ':D :D :D']
-
-        content = str(msg.clean_content)
-        for key, replacement in substitution.items():
-            content = content.replace(key, replacement)
-        content = random.choice(prefixes) + ' ' + content + ' ' + random.choice(suffixes)
-
+        content = self.transforms['owo'](str(msg.clean_content))
         await ctx.respond(content)
 
     @message_command(name='sPOnGeMoCK')
@@ -134,28 +206,50 @@ class Misc(Cog):
         if msg.author.bot:
             raise PermissionError('Cannot use message commands on bots.')
 
-        content = ''
-        for letter in str(msg.clean_content):
-            if random.random() > 0.5:
-                content += letter.upper()
-            else:
-                content += letter.lower()
-        await ctx.respond(content)
+        await ctx.respond(textfx.spongemock(str(msg.clean_content)))
+
+    @slash_command(name='transform')
+    @option('name', str, description='Enter transform name')
+    @option('text', str, description='Enter text to transform')
+    async def transform(self, ctx:AppCtx, name, text):
+        """ Transform text using one of the configured text transforms. """
+        if name not in self.transforms:
+            raise ValueError('Unknown transform: {}. Available transforms: {}'
+                             .format(name, ', '.join(self.transforms)))
+        await ctx.respond(self.transforms[name](text))
 
     @slash_command(name='roll')
     @option('rolls', int, description='Enter number of rolls to do', required=False, default=1)
     @option('low', int, description='Enter lower bound', required=False, default=1)
     @option('high', int, description='Enter upper bound', required=False, default=6)
-    async def roll(self, ctx:AppCtx, rolls, low, high):
+    @option('notation', str, description='Enter dice notation, e.g. 4d6+2, 4d6kh3, 2d6! (overrides low & high)', required=False, default=None)
+    async def roll(self, ctx:AppCtx, rolls, low, high, notation):
         """ Roll random numbers. """
-        if low > high:
-            # Swap values if in wrong order
-            low, high = high, low
         if not 1 <= rolls <= self.bot.cfg.misc.max_rolls:
             raise ValueError('Number of rolls must be between 1 and {}'.format(self.bot.cfg.misc.max_rolls))
-
-        result = ', '.join(str(random.randint(low, high)) for _ in range(rolls))
-        await ctx.respond('🎲 ' + result)
+        if notation:
+            die = dice.Dice.parse(notation)
+        else:
+            die = dice.Dice(low=low, high=high)
+        if rolls * die.count > self.bot.cfg.misc.max_rolls:
+            raise ValueError('Total number of dice rolled must be at most {}'.format(self.bot.cfg.misc.max_rolls))
+
+        listed = rolls <= self.bot.cfg.misc.get('max_listed_rolls', 100)
+        if not listed:
+            await ctx.defer()
+        results = await self.bot.loop.run_in_executor(None, die.roll, rolls)
+
+        if listed:
+            result = '🎲 ' + ', '.join(map(str, results.tolist()))
+            if len(result) <= 2000:
+                await ctx.respond(result)
+                return
+            # Listing is too long for one message, render a histogram instead
+            await ctx.defer()
+
+        # Too many rolls to list, respond with a summary instead
+        bio = await self.bot.loop.run_in_executor(None, dice.histogram, results, '{} × {}'.format(rolls, die))
+        await ctx.respond('🎲 {}\n{}'.format(die, dice.summary(results)), file=File(bio, 'rolls.png'))
 
     @slash_command(name='choose')
     @option('choices', str, description='List choices separated by commas')
@@ -166,17 +260,147 @@ class Misc(Cog):
 
 
 class Garf(Cog):
+    # Seconds to wait after the scheduler fails before trying again
+    RETRY_DELAY = 60
+
     def __init__(self, bot):
         self.bot = bot
+        self.schedule = []
+        self.schedule_changed = asyncio.Event()
+        self.scheduler = None
 
     @slash_command(name='garf')
     async def garf(self, ctx:AppCtx):
         """ Fetch a random 3-panel Garfield comic. """
         await ctx.defer()
         comic = garfield.fetch(self.bot.cfg.garf.url)
-        await ctx.respond(file=File(BytesIO(comic), filename='comic.gif'))
+        await ctx.respond(file=File(imaging.wrap(comic, 'garf'), filename='comic.gif'))
 
-    # TODO: garfield scheduler
+    garfsched = SlashCommandGroup(
+        'garfschedule',
+        'Schedule Garfield comics.',
+        default_member_permissions=Permissions(manage_channels=True)
+    )
+
+    @garfsched.command(name='add')
+    @option('hours', float, description='Enter hours between comics')
+    @option('channel', TextChannel, description='Channel to post comics in', required=False)
+    async def garf_schedule(self, ctx:AppCtx, hours, channel):
+        """ Post a random Garfield comic in a channel on a schedule. """
+        channel = channel or ctx.channel
+        min_interval = self.bot.cfg.garf.get('min_interval', 3600)
+        if hours * 3600 < min_interval:
+            raise ValueError('Comics can be posted at most every {:g} hours.'.format(min_interval / 3600))
+
+        self.remove_schedule(channel.id)
+        self.schedules.append(Config(loads={
+            'channel': channel.id,
+            'interval': hours * 3600,
+            'next': time.time() + hours * 3600,
+        }))
+        self.bot.cfg.save()
+        self.bot.config_changed()
+        self.load_schedule()
+        await ctx.respond('Posting a comic in {} every {:g} hours.'.format(channel.mention, hours))
+
+    @garfsched.command(name='remove')
+    @option('channel', TextChannel, description='Channel to stop posting comics in', required=False)
+    async def garf_unschedule(self, ctx:AppCtx, channel):
+        """ Stop posting scheduled Garfield comics in a channel. """
+        channel = channel or ctx.channel
+        if not self.remove_schedule(channel.id):
+            raise ValueError('{} has no scheduled comics.'.format(channel.mention))
+        self.bot.cfg.save()
+        self.bot.config_changed()
+        self.load_schedule()
+        await ctx.respond('Stopped posting comics in {}.'.format(channel.mention))
+
+    @property
+    def schedules(self) -> ConfigList:
+        """ Scheduled posts in the config, added if the config predates scheduling. """
+        if 'schedules' not in self.bot.cfg.garf:
+            self.bot.cfg.garf.schedules = ConfigList()
+        return self.bot.cfg.garf.schedules
+
+    def remove_schedule(self, channel_id):
+        schedules = self.schedules
+        for i, entry in enumerate(schedules):
+            if entry.channel == channel_id:
+                del schedules[i]
+                return True
+        return False
+
+    def load_schedule(self):
+        """ Rebuild the heap of (due time, channel id) from the config and wake the scheduler. """
+        self.schedule = [(entry.next, entry.channel) for entry in self.schedules]
+        heapq.heapify(self.schedule)
+        self.schedule_changed.set()
+
+    @Cog.listener()
+    async def on_ready(self):
+        # When sharded, only one process posts scheduled comics
+        if self.scheduler is None and self.bot.is_primary:
+            self.load_schedule()
+            self.scheduler = self.bot.loop.create_task(self.run_scheduler())
+
+    @Cog.listener()
+    async def on_config_reload(self):
+        self.load_schedule()
+
+    async def run_scheduler(self):
+        """ Run scheduler ticks until cancelled. A failing tick is logged and retried after RETRY_DELAY. """
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                print('Ignoring exception in garfield scheduler:', file=sys.stderr)
+                traceback.print_exception(type(e), e, e.__traceback__, file=sys.stderr)
+                await asyncio.sleep(self.RETRY_DELAY)
+
+    async def tick(self):
+        """ Sleep until the next comic is due, then fetch one comic and post it to every due channel. """
+        self.schedule_changed.clear()
+        timeout = self.schedule[0][0] - time.time() if self.schedule else None
+        if timeout is None or timeout > 0:
+            try:
+                await asyncio.wait_for(self.schedule_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        now = time.time()
+        due = []
+        while self.schedule and self.schedule[0][0] <= now:
+            due.append(heapq.heappop(self.schedule)[1])
+
+        try:
+            await self.post_scheduled(due)
+        finally:
+            # Reschedule even if posting failed, skipping any posts that were missed while the
+            # bot was offline. The heap is rebuilt before saving so that a failed save can't
+            # drop the due channels from it.
+            for entry in self.schedules:
+                if entry.channel in due:
+                    while entry.next <= now:
+                        entry.next += entry.interval
+            self.load_schedule()
+            self.bot.cfg.save()
+            self.bot.config_changed()
+
+    async def post_scheduled(self, channel_ids):
+        comic = await self.bot.loop.run_in_executor(None, garfield.fetch, self.bot.cfg.garf.url)
+        limit = asyncio.Semaphore(self.bot.cfg.garf.get('max_concurrent_posts', 5))
+
+        async def post(channel_id):
+            async with limit:
+                channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+                await channel.send(file=File(imaging.wrap(comic, 'garf'), filename='comic.gif'))
+
+        results = await asyncio.gather(*map(post, channel_ids), return_exceptions=True)
+        for channel_id, result in zip(channel_ids, results):
+            if isinstance(result, Exception):
+                print('Failed to post scheduled comic in channel {}:'.format(channel_id), file=sys.stderr)
+                traceback.print_exception(type(result), result, result.__traceback__, file=sys.stderr)
 
 
 class UrbanDictionary(Cog):
@@ -324,16 +548,42 @@ class Voice(Cog):
 class Calculator(Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.math_ctx = calc.create_default_context()
-        self.saved_math = create_storage('saved_math')
-        self.load()
-        print('Saved math loaded using {}'.format(self.saved_math))
+        self.contexts = ContextCache(self.bot.cfg)
+        self.evictor = None
+        self._tex = None
+        self._tex_lock = threading.Lock()
+        self.figures = graphing.FigurePool(self.bot.cfg.calc.get('figure_pool_size', 2))
+
+    @property
+    def tex(self) -> texrender.TexRenderer:
+        """
+        The LaTeX renderer, created on first use so that a missing or broken TeX install only
+        breaks /calc latex. Creation is retried on the next use if it fails. Blocks, so use it
+        from an executor.
+        """
+        with self._tex_lock:
+            if self._tex is None:
+                self._tex = texrender.TexRenderer(
+                    workers=self.bot.cfg.calc.get('tex_workers', 2),
+                    timeout=self.bot.cfg.calc.timeout
+                )
+            return self._tex
+
+    @Cog.listener()
+    async def on_ready(self):
+        if self.evictor is None:
+            self.evictor = self.bot.loop.create_task(self.evict_contexts())
+
+    async def evict_contexts(self):
+        """ Drop idle math contexts even when no /calc commands arrive. """
+        while True:
+            await asyncio.sleep(max(self.contexts.idle_timeout / 4, 1))
+            self.contexts.evict()
 
-    def load(self):
-        calc.load_contexts(self.math_ctx, self.saved_math.load().get('contexts', [{}]))
-    def save(self):
-        data = {'contexts': calc.dump_contexts(self.math_ctx)}
-        self.saved_math.save(data)
+    async def get_context(self, ctx:AppCtx) -> MathContext:
+        """ Get the math context for the guild the command was used in, or the user in DMs. """
+        key = ctx.guild_id if ctx.guild_id is not None else 'dm{}'.format(ctx.author.id)
+        return await self.bot.loop.run_in_executor(None, self.contexts.get, key)
 
     group = SlashCommandGroup('calc', 'Play audio in a voice channel.')
 
@@ -342,12 +592,13 @@ class Calculator(Cog):
     async def evaluate(self, ctx:AppCtx, expression):
         """ Evaluate an expression. """
         await ctx.defer()
+        math = await self.get_context(ctx)
         with stopit.ThreadingTimeout(self.bot.cfg.calc.timeout) as timer:
             expression = expression.replace(' ', '')
-            result = calc.evaluate(self.math_ctx, expression)
+            result = calc.evaluate(math.ctx, expression)
             if isinstance(result, calc.CustomFunction):
-                self.math_ctx.add(result)
-                self.save()
+                math.ctx.add(result)
+                math.save()
 
         if timer.state == timer.TIMED_OUT:
             raise TimeoutError("Evaluation took too long.")
@@ -361,35 +612,38 @@ class Calculator(Cog):
     async def latex(self, ctx:AppCtx, expression, evaluate, render):
         """ Render an expression as a LaTeX image. """
         await ctx.defer()
-        with stopit.ThreadingTimeout(self.bot.cfg.calc.timeout) as timer:
-            if expression.startswith('$') and expression.endswith('$'):
-                tex = expression.lstrip('$').rstrip('$')
-            else:
-                if evaluate:
-                    expression = calc.evaluate(self.math_ctx, expression)
-                tex = calc.latex(self.math_ctx, expression)
-            if render:
-                img = calc.latex_to_image(tex, dpi=self.bot.cfg.calc.latex_dpi)
-
-        if timer.state == timer.TIMED_OUT:
-            raise TimeoutError("Evaluation took too long.")
-
+        math = await self.get_context(ctx)
+
+        def run():
+            # Create the renderer outside the timeout, building the format takes longer than a render
+            tex_renderer = self.tex if render else None
+            with stopit.ThreadingTimeout(self.bot.cfg.calc.timeout) as timer:
+                if expression.startswith('$') and expression.endswith('$'):
+                    tex = expression.lstrip('$').rstrip('$')
+                else:
+                    tex = calc.latex(math.ctx, calc.evaluate(math.ctx, expression) if evaluate else expression)
+                if render:
+                    img = tex_renderer.render(tex, dpi=self.bot.cfg.calc.latex_dpi)
+
+            if timer.state == timer.TIMED_OUT:
+                raise TimeoutError("Evaluation took too long.")
+            return imaging.encode_image(img, 'latex') if render else tex
+
+        # Render off the event loop so that the TeX workers can serve requests in parallel
+        result = await self.bot.loop.run_in_executor(None, run)
         if render:
-            with BytesIO() as bio:
-                img.save(bio, format='png')
-                bio.seek(0)
-                await ctx.respond(file=File(bio, 'tex.png'))
+            await ctx.respond(file=File(result, 'tex.png'))
         else:
-            await ctx.respond('```' + tex + '```')
+            await ctx.respond('```' + result + '```')
 
     @group.command(name='graph')
-    @option('expression', str, description='Enter an expression to graph, or a function name')
+    @option('expression', str, description='Enter expressions to graph or function names, separated by ;')
     @option('xlow', float, description='Enter lower x axis bound', required=False, default=-10)
     @option('xhigh', float, description='Enter upper x axis bound', required=False, default=10)
     @option('ylow', float, description='Enter lower y axis bound', required=False, default=None)
     @option('yhigh', float, description='Enter upper y axis bound', required=False, default=None)
     async def graph(self, ctx: AppCtx, expression, xlow, xhigh, ylow, yhigh):
-        """ Plot a 1-dimensional function on the xy plane. """
+        """ Plot 1-dimensional functions on the xy plane. """
         await ctx.defer()
 
         trimmed = expression.replace(' ', '').lower()
@@ -397,16 +651,26 @@ class Calculator(Cog):
             await ctx.respond(self.bot.cfg.calc.meme_graphs[trimmed])
             return
 
-        with stopit.ThreadingTimeout(self.bot.cfg.calc.timeout) as timer:
-            fig = calc.graph(
-                self.math_ctx, expression,
-                xlow, xhigh,
-                ylow, yhigh,
-                tex_title=self.bot.cfg.calc.use_tex_graph_title
-            )
-            bio = calc.savefig_bytesio(fig)
+        expressions = [e.strip() for e in expression.split(';') if e.strip()]
+        max_graphs = self.bot.cfg.calc.get('max_graphs', 5)
+        if not 1 <= len(expressions) <= max_graphs:
+            raise ValueError('Number of functions must be between 1 and {}'.format(max_graphs))
 
-        if timer.state == timer.TIMED_OUT:
-            raise TimeoutError("Evaluation took too long.")
+        math = await self.get_context(ctx)
+
+        def render():
+            with stopit.ThreadingTimeout(self.bot.cfg.calc.timeout) as timer:
+                bio = graphing.graph(
+                    self.figures, math.ctx, expressions,
+                    xlow, xhigh,
+                    ylow, yhigh,
+                    tex_title=self.bot.cfg.calc.use_tex_graph_title
+                )
+
+            if timer.state == timer.TIMED_OUT:
+                raise TimeoutError("Evaluation took too long.")
+            return bio
 
+        # Render off the event loop so that graphs can render in parallel
+        bio = await self.bot.loop.run_in_executor(None, render)
         await ctx.respond(file=File(bio, 'graph.png'))
@@ -0,0 +1,108 @@
+import re
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import imaging
+
+_rng = np.random.default_rng()
+_notation = re.compile(r'(\d*)d(\d+)(?:k([hl]?)(\d+))?(!?)([+-]\d+)?')
+
+# Maximum number of times a single die may explode
+MAX_EXPLOSIONS = 100
+# Maximum number of bars in a roll histogram
+MAX_HISTOGRAM_BINS = 100
+
+
+class Dice:
+    """ A dice expression, e.g. 4d6+2. Each die rolls an integer between low and high inclusive. """
+    def __init__(self, count=1, low=1, high=6, keep=None, keep_lowest=False, explode=False, modifier=0):
+        if low > high:
+            # Swap values if in wrong order
+            low, high = high, low
+        if count < 1:
+            raise ValueError('Number of dice must be at least 1.')
+        if keep is not None and not 1 <= keep <= count:
+            raise ValueError('Number of dice to keep must be between 1 and {}.'.format(count))
+        self.count = count
+        self.low = low
+        self.high = high
+        self.keep = keep
+        self.keep_lowest = keep_lowest
+        self.explode = explode and low < high
+        self.modifier = modifier
+
+    @classmethod
+    def parse(cls, notation):
+        """ Parse dice notation: [count]d<sides>[k|kh|kl<keep>][!][+|-<modifier>] """
+        match = _notation.fullmatch(notation.replace(' ', '').lower())
+        if not match:
+            raise ValueError('Invalid dice notation: {}'.format(notation))
+        count, sides, keep_mode, keep, explode, modifier = match.groups()
+        if int(sides) < 1:
+            raise ValueError('Dice must have at least 1 side.')
+        return cls(
+            count=int(count or 1),
+            high=int(sides),
+            keep=int(keep) if keep else None,
+            keep_lowest=keep_mode == 'l',
+            explode=bool(explode),
+            modifier=int(modifier or 0)
+        )
+
+    def roll(self, rolls=1):
+        """ Roll the dice expression `rolls` times and return an array of totals. """
+        values = _rng.integers(self.low, self.high, size=(rolls, self.count), endpoint=True)
+
+        if self.explode:
+            exploding = values == self.high
+            for _ in range(MAX_EXPLOSIONS):
+                n = np.count_nonzero(exploding)
+                if n == 0:
+                    break
+                extra = _rng.integers(self.low, self.high, size=n, endpoint=True)
+                values[exploding] += extra
+                exploding[exploding] = extra == self.high
+
+        if self.keep is not None and self.keep < self.count:
+            values.sort(axis=1)
+            values = values[:, :self.keep] if self.keep_lowest else values[:, -self.keep:]
+
+        return values.sum(axis=1) + self.modifier
+
+    def __str__(self):
+        s = '{}d{}'.format(self.count, self.high) if self.low == 1 else '{}d[{}-{}]'.format(self.count, self.low, self.high)
+        if self.keep is not None:
+            s += '{}{}'.format('kl' if self.keep_lowest else 'kh', self.keep)
+        if self.explode:
+            s += '!'
+        if self.modifier:
+            s += '{:+}'.format(self.modifier)
+        return s
+
+
+def summary(results):
+    """ Summary text of an array of roll totals. """
+    return 'Rolls: **{}**\nSum: **{}**\nMean: **{:.4f}**\nStd: **{:.4f}**\nMin: **{}**\nMax: **{}**'.format(
+        results.size, results.sum(), results.mean(), results.std(), results.min(), results.max()
+    )
+
+def histogram(results, title=None):
+    """ Render a histogram of roll totals as a png in a BytesIO. """
+    lowest, highest = results.min(), results.max()
+    if highest - lowest < MAX_HISTOGRAM_BINS:
+        # One bin per total
+        bins = np.arange(lowest, highest + 2) - 0.5
+    else:
+        bins = MAX_HISTOGRAM_BINS
+    fig = Figure()
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.hist(results, bins=bins)
+    ax.set_xlabel('Total')
+    ax.set_ylabel('Count')
+    if title:
+        ax.set_title(title)
+
+    return imaging.encode_canvas(canvas, 'histogram')
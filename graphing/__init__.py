@@ -0,0 +1,217 @@
+import queue
+from contextlib import contextmanager
+
+import calc
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import imaging
+
+# Number of evenly spaced points sampled before refining
+INITIAL_POINTS = 129
+# Maximum number of points sampled per function
+MAX_POINTS = 8192
+# Maximum number of times an interval can be subdivided
+MAX_DEPTH = 10
+# Relative error (as a fraction of the y range) below which an interval is considered smooth
+TOLERANCE = 5e-3
+# Change in y (as a fraction of the y range) across one interval that is treated as a possible jump
+JUMP = 0.05
+
+
+def compile_function(math_ctx, expression):
+    """
+    Compile an expression or function name into a callable that takes a numpy array of x values
+    and returns an array of y values.
+    """
+    try:
+        func = calc.evaluate(math_ctx, expression)
+    except Exception:
+        func = None
+    if not callable(func):
+        # Not a function name or definition, wrap it in a function of x
+        func = calc.evaluate(math_ctx, 'y(x)=' + expression)
+    return vectorize(func)
+
+def vectorize(func):
+    """
+    Return a version of func that evaluates a whole array at once. Functions that already
+    accept numpy arrays are used directly, otherwise they are mapped element by element.
+    """
+    probe = np.linspace(0, 1, 3)
+    try:
+        result = np.asarray(func(probe), dtype=float)
+        if result.shape == probe.shape:
+            return lambda x: np.asarray(func(x), dtype=float)
+    except Exception:
+        pass
+
+    def scalar(x):
+        try:
+            return float(func(x))
+        except (ArithmeticError, ValueError, TypeError):
+            return np.nan
+
+    ufunc = np.frompyfunc(scalar, 1, 1)
+    return lambda x: ufunc(x).astype(float)
+
+
+def sample(func, xlow, xhigh):
+    """
+    Adaptively sample a vectorized function between xlow and xhigh. Intervals are subdivided
+    where the function deviates from a straight line, and the line is broken with NaN where
+    the function is discontinuous. Every refinement pass evaluates all new points in a single
+    call.
+    """
+    x = np.linspace(xlow, xhigh, INITIAL_POINTS)
+    with np.errstate(all='ignore'):
+        y = func(x)
+    scale = _scale(y)
+
+    for _ in range(MAX_DEPTH):
+        refine = _needs_refinement(y, scale)
+        if not refine.any() or x.size + np.count_nonzero(refine) > MAX_POINTS:
+            break
+
+        new_x = ((x[:-1] + x[1:]) / 2)[refine]
+        with np.errstate(all='ignore'):
+            new_y = func(new_x)
+        x = np.concatenate((x, new_x))
+        y = np.concatenate((y, new_y))
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+
+    return _break_discontinuities(func, x, y, scale)
+
+def _scale(y):
+    """ Typical y range of evenly spaced samples, ignoring outliers such as asymptotes. """
+    finite = y[np.isfinite(y)]
+    if finite.size == 0:
+        return 1
+    low, high = np.percentile(finite, [2, 98])
+    return high - low or 1
+
+def _needs_refinement(y, scale):
+    """ Mark intervals whose endpoints bend sharply, jump, or switch between finite and non-finite. """
+    finite = np.isfinite(y)
+    refine = finite[:-1] != finite[1:]
+
+    # Second difference around each interior point, attributed to both neighbouring intervals
+    bend = np.zeros(y.size - 1, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        curvature = np.abs(y[:-2] - 2 * y[1:-1] + y[2:]) > TOLERANCE * scale
+        jump = np.abs(np.diff(y)) > JUMP * scale
+    bend[:-1] |= curvature
+    bend[1:] |= curvature
+    return refine | bend | jump
+
+def _break_discontinuities(func, x, y, scale):
+    """
+    Insert NaN into intervals with a large jump whose midpoint does not lie between its
+    endpoints, so that the two sides of a discontinuity aren't connected.
+    """
+    with np.errstate(invalid='ignore'):
+        candidates = np.flatnonzero(np.abs(np.diff(y)) > JUMP * scale)
+    if candidates.size == 0:
+        return x, y
+
+    mid_x = (x[candidates] + x[candidates + 1]) / 2
+    with np.errstate(all='ignore'):
+        mid_y = func(mid_x)
+    a, b = y[candidates], y[candidates + 1]
+    slack = TOLERANCE * scale
+    outside = (mid_y > np.maximum(a, b) + slack) | (mid_y < np.minimum(a, b) - slack) | ~np.isfinite(mid_y)
+    breaks = candidates[outside] + 1
+    return np.insert(x, breaks, mid_x[outside]), np.insert(y, breaks, np.nan)
+
+
+class PooledFigure:
+    """ A figure with its Agg canvas and axes set up once. Only artists added by a render are reset. """
+    def __init__(self):
+        self.fig = Figure()
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.ax.axhline(0, color='black', linewidth=0.75)
+        self.ax.axvline(0, color='black', linewidth=0.75)
+        self.ax.grid(alpha=0.5)
+        self._base = set(self.ax.get_children())
+
+    def reset(self):
+        for artist in self.ax.get_children():
+            if artist not in self._base:
+                artist.remove()
+        legend = self.ax.get_legend()
+        if legend is not None:
+            legend.remove()
+        self.ax.set_title('')
+        self.ax.set_prop_cycle(None)
+
+class FigurePool:
+    """
+    Pool of pre-built figures rendered with Agg directly, without pyplot's global state. Each
+    figure is used by one thread at a time, so several graphs can render in parallel.
+    """
+    def __init__(self, size=2):
+        self._figures = queue.LifoQueue()
+        for _ in range(size):
+            self._figures.put(PooledFigure())
+
+    @contextmanager
+    def acquire(self):
+        figure = self._figures.get()
+        try:
+            yield figure
+        finally:
+            try:
+                figure.reset()
+            except Exception:
+                # Don't return a figure in an unknown state to the pool
+                figure = PooledFigure()
+            self._figures.put(figure)
+
+
+def graph(pool, math_ctx, expressions, xlow=-10, xhigh=10, ylow=None, yhigh=None, tex_title=False):
+    """ Plot one or more expressions or function names on the xy plane and return a png in a BytesIO. """
+    if xlow > xhigh:
+        xlow, xhigh = xhigh, xlow
+
+    curves = []
+    visible = []
+    for expression in expressions:
+        func = compile_function(math_ctx, expression)
+        x, y = sample(func, xlow, xhigh)
+        label = '${}$'.format(calc.latex(math_ctx, expression)) if tex_title else expression
+        curves.append((x, y, label))
+
+        # Samples are concentrated around steep regions, so use an even grid to choose y bounds
+        with np.errstate(all='ignore'):
+            even = func(np.linspace(xlow, xhigh, INITIAL_POINTS))
+        visible.append(even[np.isfinite(even)])
+
+    with pool.acquire() as figure:
+        ax = figure.ax
+        for x, y, label in curves:
+            ax.plot(x, y, label=label)
+        ax.set_xlim(xlow, xhigh)
+        ax.set_ylim(*_ylim(np.concatenate(visible), ylow, yhigh))
+        if len(curves) > 1:
+            ax.legend()
+        else:
+            ax.set_title(curves[0][2])
+        return imaging.encode_canvas(figure.canvas, 'graph')
+
+def _ylim(y, ylow, yhigh):
+    """ Choose y bounds, ignoring asymptotes that would flatten the rest of the graph. """
+    if ylow is not None and yhigh is not None:
+        return min(ylow, yhigh), max(ylow, yhigh)
+    if y.size == 0:
+        low, high = -1, 1
+    else:
+        low, high = y.min(), y.max()
+        qlow, qhigh = np.percentile(y, [2, 98])
+        if high - low > 3 * (qhigh - qlow) > 0:
+            low, high = qlow, qhigh
+        pad = (high - low) * 0.05 or 1
+        low, high = low - pad, high + pad
+    return ylow if ylow is not None else low, yhigh if yhigh is not None else high
@@ -0,0 +1,119 @@
+import threading
+import time
+from io import BytesIO
+
+from PIL import Image
+
+# Encoding settings for each kind of image. Line plots and TeX have few distinct colours, so
+# they quantize to a palette with almost no visible loss.
+PROFILES = {
+    'graph': dict(colors=256, compress_level=6),
+    'latex': dict(colors=64, compress_level=6),
+    'histogram': dict(colors=64, compress_level=6),
+}
+DEFAULT_PROFILE = dict(colors=None, compress_level=6)
+
+
+class EncodeStats:
+    """
+    Running totals of encoded images per kind, for monitoring. Savings are measured against the
+    default png encoding (what img.save and savefig produced before), which is also encoded
+    for every BASELINE_EVERY-th image of each kind and extrapolated to the rest.
+    """
+    BASELINE_EVERY = 10
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.data = {}
+
+    def _entry(self, kind):
+        return self.data.setdefault(kind, dict(
+            count=0, encoded_bytes=0, seconds=0.0,
+            sampled=0, sampled_encoded_bytes=0, sampled_baseline_bytes=0, baseline_seconds=0.0
+        ))
+
+    def wants_baseline(self, kind):
+        with self._lock:
+            return self._entry(kind)['count'] % self.BASELINE_EVERY == 0
+
+    def record(self, kind, encoded_bytes, seconds, baseline_bytes=None, baseline_seconds=0.0):
+        with self._lock:
+            entry = self._entry(kind)
+            entry['count'] += 1
+            entry['encoded_bytes'] += encoded_bytes
+            entry['seconds'] += seconds
+            if baseline_bytes is not None:
+                entry['sampled'] += 1
+                entry['sampled_encoded_bytes'] += encoded_bytes
+                entry['sampled_baseline_bytes'] += baseline_bytes
+                entry['baseline_seconds'] += baseline_seconds
+
+    def saved_bytes(self, kind):
+        """ Estimated bytes saved compared to the default png encoding. """
+        with self._lock:
+            entry = self._entry(kind)
+            if not entry['sampled_encoded_bytes']:
+                return 0
+            ratio = entry['sampled_baseline_bytes'] / entry['sampled_encoded_bytes']
+            return entry['encoded_bytes'] * (ratio - 1)
+
+    def __str__(self):
+        with self._lock:
+            kinds = sorted(self.data)
+        if not kinds:
+            return 'No images encoded yet.'
+        lines = []
+        for kind in kinds:
+            saved = self.saved_bytes(kind)
+            entry = self.data[kind]
+            line = '{}: {} images, {:.1f} KiB sent, ~{:.1f} KiB saved vs default png, {:.1f} ms avg encode'.format(
+                kind, entry['count'], entry['encoded_bytes'] / 1024, saved / 1024,
+                entry['seconds'] / entry['count'] * 1000
+            )
+            if entry['sampled'] and entry['baseline_seconds']:
+                line += ' ({:.1f} ms default)'.format(entry['baseline_seconds'] / entry['sampled'] * 1000)
+            lines.append(line)
+        return '\n'.join(lines)
+
+stats = EncodeStats()
+
+
+def encode_image(img:Image.Image, kind):
+    """ Encode a PIL image as a png using the profile for its kind, and return it in a BytesIO. """
+    profile = PROFILES.get(kind, DEFAULT_PROFILE)
+    baseline_bytes = None
+    baseline_seconds = 0.0
+    if stats.wants_baseline(kind):
+        start = time.perf_counter()
+        baseline = BytesIO()
+        img.save(baseline, format='png')
+        baseline_bytes = baseline.tell()
+        baseline_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if profile['colors']:
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        # Fast octree is the only quantizer that supports an alpha channel
+        img = img.quantize(profile['colors'], method=Image.Quantize.FASTOCTREE)
+
+    bio = BytesIO()
+    img.save(bio, format='png', compress_level=profile['compress_level'])
+    stats.record(kind, bio.tell(), time.perf_counter() - start, baseline_bytes, baseline_seconds)
+    bio.seek(0)
+    return bio
+
+def encode_canvas(canvas, kind):
+    """
+    Draw a matplotlib Agg canvas and encode it. The image shares the canvas's pixel buffer
+    instead of copying it, so the canvas must not be reused until this returns.
+    """
+    canvas.draw()
+    width, height = canvas.get_width_height()
+    img = Image.frombuffer('RGBA', (width, height), canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+    return encode_image(img, kind)
+
+def wrap(data:bytes, kind):
+    """ Wrap already encoded image data (e.g. a downloaded gif) without re-encoding or copying it. """
+    stats.record(kind, len(data), 0.0, len(data))
+    return BytesIO(data)
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+import calc
+
+from util import create_storage
+
+
+class MathContext:
+    def __init__(self, key, storage):
+        self.key = key
+        self.storage = storage
+        self.ctx = calc.create_default_context()
+        self.last_used = time.monotonic()
+
+    def load(self, fallback=None):
+        """ Load the saved contexts, or the ones returned by `fallback` if there are none. """
+        try:
+            data = self.storage.load()
+        except FileNotFoundError:
+            data = {}
+        contexts = data.get('contexts') or (fallback() if fallback else None)
+        calc.load_contexts(self.ctx, contexts or [{}])
+
+    def save(self):
+        self.storage.save({'contexts': calc.dump_contexts(self.ctx)})
+
+class ContextCache:
+    """
+    Calculator contexts partitioned by key (guild), loaded from storage on first use and kept in
+    least recently used order. Contexts idle for longer than cfg.calc.context_idle_timeout
+    seconds are evicted, as are the least recently used ones past cfg.calc.max_contexts.
+    Contexts are saved whenever they change, so eviction only drops them from memory.
+
+    Memory is capped by the number of contexts rather than their size in bytes, which calc
+    doesn't expose and would be slow to estimate on every use.
+
+    Keys without saved contexts of their own start from the contexts saved before math was
+    partitioned by guild, so existing definitions are kept.
+    """
+    DEFAULT_MAX_CONTEXTS = 100
+    DEFAULT_IDLE_TIMEOUT = 3600
+
+    def __init__(self, cfg, label='saved_math'):
+        self.cfg = cfg
+        self.label = label
+        self.contexts = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._shared = None
+        self._shared_lock = threading.Lock()
+
+    @property
+    def max_contexts(self):
+        return self.cfg.calc.get('max_contexts', self.DEFAULT_MAX_CONTEXTS)
+
+    @property
+    def idle_timeout(self):
+        return self.cfg.calc.get('context_idle_timeout', self.DEFAULT_IDLE_TIMEOUT)
+
+    def _shared_contexts(self):
+        """ The contexts saved before math was partitioned by guild, loaded once. """
+        with self._shared_lock:
+            if self._shared is None:
+                try:
+                    self._shared = create_storage(self.label).load().get('contexts') or []
+                except FileNotFoundError:
+                    self._shared = []
+            return self._shared
+
+    def get(self, key) -> MathContext:
+        """
+        Get the context for a key, loading it from storage if it isn't in memory. Storage is read
+        outside the cache lock, so only requests for the same key wait on each other.
+        """
+        with self._lock:
+            context = self.contexts.get(key)
+            if context is None:
+                key_lock = self._loading.setdefault(key, threading.Lock())
+
+        if context is None:
+            with key_lock:
+                with self._lock:
+                    context = self.contexts.get(key)
+                if context is None:
+                    # Not loaded by another request while this one waited
+                    context = MathContext(key, create_storage(self.label, key))
+                    context.load(self._shared_contexts)
+                    with self._lock:
+                        self.contexts[key] = context
+                        self._loading.pop(key, None)
+
+        with self._lock:
+            if key in self.contexts:
+                self.contexts.move_to_end(key)
+            context.last_used = time.monotonic()
+        self.evict()
+        return context
+
+    def evict(self):
+        """ Evict contexts from the least recently used end while they are idle or over the cap. """
+        max_contexts, idle_timeout = self.max_contexts, self.idle_timeout
+        with self._lock:
+            now = time.monotonic()
+            while self.contexts:
+                context = next(iter(self.contexts.values()))
+                if len(self.contexts) <= max_contexts and now - context.last_used < idle_timeout:
+                    break
+                self.contexts.popitem(last=False)
+
+    def __len__(self):
+        return len(self.contexts)
@@ -0,0 +1,112 @@
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+
+# Only one capture may run at a time
+_capture_lock = threading.Lock()
+
+
+class CaptureInProgress(Exception):
+    pass
+
+class StackSampler(threading.Thread):
+    """ Samples the stacks of all other threads at a fixed interval and counts collapsed stacks. """
+    def __init__(self, interval=0.005):
+        super().__init__(name='blurbot-stack-sampler', daemon=True)
+        self.interval = interval
+        self.counts = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self):
+        """ Stacks in the collapsed format used by flamegraph.pl and speedscope. """
+        return '\n'.join('{} {}'.format(stack, count) for stack, count in self.counts.most_common())
+
+
+def _acquire():
+    if not _capture_lock.acquire(blocking=False):
+        raise CaptureInProgress('A profiling capture is already running.')
+
+async def profile_cpu(seconds, top=30):
+    """
+    Profile the event loop thread with cProfile and sample every thread's stack for the given
+    number of seconds. Returns a dict of filename to file contents.
+    """
+    _acquire()
+    try:
+        sampler = StackSampler()
+        profiler = cProfile.Profile()
+        sampler.start()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+            sampler.stop()
+    finally:
+        _capture_lock.release()
+
+    stats = pstats.Stats(profiler)
+    text = io.StringIO()
+    stats.stream = text
+    stats.sort_stats('cumulative').print_stats(top)
+    return {
+        'cpu.pstats': marshal.dumps(stats.stats),
+        'cpu-top.txt': text.getvalue().encode(),
+        'cpu-stacks.txt': sampler.collapsed().encode(),
+    }
+
+async def profile_mem(seconds, top=30):
+    """
+    Compare tracemalloc snapshots taken before and after the given number of seconds. Returns
+    a dict of filename to file contents.
+    """
+    _acquire()
+    try:
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(25)
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+    finally:
+        _capture_lock.release()
+
+    lines = ['Traced memory: {:.1f} KiB current, {:.1f} KiB peak'.format(current / 1024, peak / 1024), '']
+    lines.append('Top {} allocation changes by line:'.format(top))
+    lines.extend(str(stat) for stat in after.compare_to(before, 'lineno')[:top])
+    lines.append('')
+    lines.append('Top {} allocation sites by line:'.format(top))
+    lines.extend(str(stat) for stat in after.statistics('lineno')[:top])
+    return {'mem-top.txt': '\n'.join(lines).encode()}
@@ -0,0 +1,204 @@
+import asyncio
+import importlib
+import itertools
+import multiprocessing
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.connection import wait
+
+# Seconds to wait before restarting a shard group that crashed
+RESTART_DELAY = 5
+# Seconds shard groups get to close after being told to shut down
+SHUTDOWN_TIMEOUT = 10
+
+
+class IPCClient:
+    """
+    A shard group's end of the pipe to the launcher. Messages are dicts with an 'op' key.
+    Incoming messages are handed to `handler` on the bot's event loop, except replies to
+    requests, which resolve the request's future.
+    """
+    def __init__(self, conn, group):
+        self.conn = conn
+        self.group = group
+        self.loop = None
+        self.handler = None
+        self._ids = itertools.count()
+        self._pending = {}
+        self._send_lock = threading.Lock()
+
+    def start(self, loop, handler):
+        self.loop = loop
+        self.handler = handler
+        threading.Thread(target=self._read, name='blurbot-ipc', daemon=True).start()
+
+    def _read(self):
+        while True:
+            try:
+                msg = self.conn.recv()
+            except (EOFError, OSError):
+                # Launcher is gone
+                return
+            self.loop.call_soon_threadsafe(self._dispatch, msg)
+
+    def _dispatch(self, msg):
+        future = self._pending.pop(msg.get('reply_to'), None)
+        if future is not None:
+            if not future.done():
+                future.set_result(msg)
+        else:
+            self.handler(msg)
+
+    def send(self, op, **data):
+        data['op'] = op
+        data['group'] = self.group
+        with self._send_lock:
+            self.conn.send(data)
+
+    async def request(self, op, timeout=5, **data):
+        """ Send a message to the launcher and wait for its reply. """
+        request_id = next(self._ids)
+        future = self.loop.create_future()
+        self._pending[request_id] = future
+        try:
+            self.send(op, request_id=request_id, **data)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+class ShardGroup:
+    def __init__(self, group, shard_ids):
+        self.group = group
+        self.shard_ids = shard_ids
+        self.process = None
+        self.conn = None
+        self.health = None
+        self.restarts = 0
+        self.exited_at = None
+
+class Launcher:
+    """
+    Runs shard groups in separate processes and relays messages between them. Each group
+    reports health (per-shard latency) which the launcher keeps for status requests, and
+    broadcasts (e.g. config reloads) are forwarded to every other group. Groups that crash
+    are restarted. A group that exits cleanly or sends a shutdown (e.g. from /kill) shuts
+    down the other groups and stops the launcher.
+
+    `factory` is the import path ('module:attribute') of the bot class or a function taking the
+    same arguments, so that the launcher can be run against a stub gateway.
+    """
+    def __init__(self, token, shard_count, processes, factory='blurbot:ShardedBlurbot'):
+        if not 1 <= processes <= shard_count:
+            raise ValueError('Number of processes must be between 1 and the number of shards.')
+        self.token = token
+        self.shard_count = shard_count
+        self.factory = factory
+        self.ctx = multiprocessing.get_context('spawn')
+        self.groups = [ShardGroup(g, list(range(shard_count))[g::processes]) for g in range(processes)]
+        self.running = False
+
+    def start_group(self, group:ShardGroup):
+        parent_conn, child_conn = self.ctx.Pipe()
+        group.conn = parent_conn
+        group.health = None
+        group.exited_at = None
+        group.process = self.ctx.Process(
+            target=run_group,
+            args=(self.factory, self.token, group.group, group.shard_ids, self.shard_count, child_conn),
+            name='blurbot-shards-{}'.format(group.group),
+            daemon=True
+        )
+        group.process.start()
+        child_conn.close()
+        print('Started shard group {} (shards {}) in process {}'.format(group.group, group.shard_ids, group.process.pid))
+
+    def run(self):
+        self.running = True
+        for group in self.groups:
+            self.start_group(group)
+        try:
+            while self.running:
+                self.poll(timeout=1)
+        finally:
+            self.stop()
+
+    def poll(self, timeout=None):
+        """ Handle messages from shard groups and restart groups that crashed. """
+        conns = {group.conn: group for group in self.groups if group.conn is not None}
+        for conn in wait(list(conns), timeout):
+            group = conns[conn]
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                conn.close()
+                group.conn = None
+                continue
+            try:
+                self.handle(group, msg)
+            except Exception as e:
+                print('Ignoring exception in launcher while handling {}:'.format(msg.get('op')), file=sys.stderr)
+                traceback.print_exception(type(e), e, e.__traceback__, file=sys.stderr)
+
+        for group in self.groups:
+            if group.process is not None and not group.process.is_alive():
+                if group.exited_at is None:
+                    group.exited_at = time.monotonic()
+                    print('Shard group {} exited with code {}'.format(group.group, group.process.exitcode), file=sys.stderr)
+                    if group.process.exitcode == 0:
+                        # Closed on purpose, so there's nothing to restart
+                        self.running = False
+                if self.running and time.monotonic() - group.exited_at >= RESTART_DELAY:
+                    group.restarts += 1
+                    self.start_group(group)
+
+    def handle(self, group:ShardGroup, msg):
+        op = msg['op']
+        if op == 'health':
+            group.health = dict(shards=msg['shards'], time=time.time())
+        elif op == 'broadcast':
+            for other in self.groups:
+                if other is not group and other.conn is not None:
+                    other.conn.send(msg)
+        elif op == 'status':
+            group.conn.send({'op': 'status', 'reply_to': msg['request_id'], 'groups': self.status()})
+        elif op == 'shutdown':
+            self.running = False
+
+    def status(self):
+        return [
+            dict(
+                group=group.group,
+                shard_ids=group.shard_ids,
+                alive=group.process is not None and group.process.is_alive(),
+                restarts=group.restarts,
+                health=group.health,
+            )
+            for group in self.groups
+        ]
+
+    def stop(self):
+        """ Ask every group to close, then terminate the ones that haven't within SHUTDOWN_TIMEOUT. """
+        self.running = False
+        alive = [group for group in self.groups if group.process is not None and group.process.is_alive()]
+        for group in alive:
+            try:
+                group.conn.send({'op': 'shutdown'})
+            except (AttributeError, OSError):
+                # Pipe already closed
+                pass
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for group in alive:
+            group.process.join(max(deadline - time.monotonic(), 0))
+            if group.process.is_alive():
+                group.process.terminate()
+                group.process.join(10)
+
+
+def run_group(factory, token, group, shard_ids, shard_count, conn):
+    """ Process entry point for a shard group. """
+    module, attr = factory.split(':')
+    bot_class = getattr(importlib.import_module(module), attr)
+    bot = bot_class(shard_ids=shard_ids, shard_count=shard_count, ipc=IPCClient(conn, group))
+    bot.run(token)
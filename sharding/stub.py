@@ -0,0 +1,53 @@
+"""
+A stand-in for the bot that talks to the launcher like a shard group would, without connecting
+to the gateway. Used with `Launcher(..., factory='sharding.stub:StubBot')` in tests, where the
+token is a directory that the stub records what happened in and takes instructions from:
+
+- `received-<group>` gets a line for each broadcast the group receives
+- if `crash-<group>` exists, the group removes it and crashes after its first broadcast
+- if `exit-<group>` exists, the group exits cleanly as soon as it starts
+"""
+import asyncio
+import os
+
+# Seconds between health reports
+HEALTH_INTERVAL = 0.1
+
+
+class StubBot:
+    def __init__(self, shard_ids, shard_count, ipc):
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.ipc = ipc
+        self.path = None
+        self.closed = None
+
+    def run(self, token):
+        self.path = token
+        asyncio.run(self.start())
+
+    def file(self, name):
+        return os.path.join(self.path, '{}-{}'.format(name, self.ipc.group))
+
+    async def start(self):
+        if os.path.exists(self.file('exit')):
+            return
+        self.closed = asyncio.Event()
+        self.ipc.start(asyncio.get_running_loop(), self.on_ipc_message)
+        self.ipc.send('broadcast', event='started')
+        while not self.closed.is_set():
+            self.ipc.send('health', shards={shard_id: dict(latency=0.0, closed=False) for shard_id in self.shard_ids})
+            try:
+                await asyncio.wait_for(self.closed.wait(), HEALTH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def on_ipc_message(self, msg):
+        if msg['op'] == 'broadcast':
+            with open(self.file('received'), 'a') as f:
+                f.write('{} from {}\n'.format(msg['event'], msg['group']))
+            if os.path.exists(self.file('crash')):
+                os.remove(self.file('crash'))
+                os._exit(1)
+        elif msg['op'] == 'shutdown':
+            self.closed.set()
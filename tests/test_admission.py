@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+
+import admission
+from util import Config
+
+
+def make_cfg(**overrides):
+    cfg = dict(enabled=True, global_limit=2, user_limit=1, guild_limit=2, max_wait=0.05,
+               commands={'graph': {'rate': 1, 'burst': 2}})
+    cfg.update(overrides)
+    return Config(loads={'admission': cfg})
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_token_bucket():
+    bucket = admission.TokenBucket(rate=0, burst=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() == float('inf')
+
+def test_unlimited_commands_are_not_tracked():
+    controller = admission.AdmissionController(make_cfg())
+    assert run(controller.acquire('ping', 1, 1)) is None
+    assert controller.active == 0
+
+def test_disabled_or_missing_config():
+    assert run(admission.AdmissionController(make_cfg(enabled=False)).acquire('graph', 1, 1)) is None
+    assert run(admission.AdmissionController(Config(loads={'x': 1})).acquire('graph', 1, 1)) is None
+
+def test_rate_limit():
+    controller = admission.AdmissionController(make_cfg())
+
+    async def scenario():
+        for _ in range(2):
+            await controller.release(await controller.acquire('graph', 1, 1))
+        with pytest.raises(admission.AdmissionError, match='too often'):
+            await controller.acquire('graph', 1, 1)
+        # Other users have their own buckets
+        await controller.release(await controller.acquire('graph', 2, 1))
+
+    run(scenario())
+    assert controller.stats.data['graph']['rate_limited'] == 1
+
+def test_user_limit_rejects_when_busy():
+    controller = admission.AdmissionController(make_cfg())
+
+    async def scenario():
+        ticket = await controller.acquire('graph', 1, 1)
+        with pytest.raises(admission.AdmissionError, match='Too many'):
+            await controller.acquire('graph', 1, 1)
+        await controller.release(ticket)
+
+    run(scenario())
+    assert controller.stats.data['graph']['busy'] == 1
+    assert controller.active == 0
+
+def test_busy_rejection_does_not_use_rate_limit_token():
+    controller = admission.AdmissionController(make_cfg(commands={'graph': {'rate': 0, 'burst': 2}}))
+
+    async def scenario():
+        ticket = await controller.acquire('graph', 1, 1)
+        with pytest.raises(admission.AdmissionError, match='Too many'):
+            await controller.acquire('graph', 1, 1)
+        await controller.release(ticket)
+        # The busy rejection left the second token in place
+        await controller.release(await controller.acquire('graph', 1, 1))
+
+    run(scenario())
+
+def test_waits_for_a_slot():
+    controller = admission.AdmissionController(make_cfg(global_limit=1, max_wait=1))
+
+    async def scenario():
+        ticket = await controller.acquire('graph', 1, 1)
+
+        async def release_later():
+            await asyncio.sleep(0.05)
+            await controller.release(ticket)
+
+        asyncio.create_task(release_later())
+        await controller.release(await controller.acquire('graph', 2, 1))
+
+    run(scenario())
+    assert controller.stats.data['graph']['admitted'] == 2
+    assert controller.stats.data['graph']['wait_max'] >= 0.04
+
+def test_fast_rejection_with_no_wait():
+    controller = admission.AdmissionController(make_cfg(global_limit=1, max_wait=0))
+
+    async def scenario():
+        ticket = await controller.acquire('graph', 1, 1)
+        with pytest.raises(admission.AdmissionError):
+            await controller.acquire('graph', 2, 2)
+        await controller.release(ticket)
+
+    run(scenario())
+
+def test_wait_is_capped(monkeypatch):
+    monkeypatch.setattr(admission.AdmissionController, 'MAX_WAIT', 0.05)
+    controller = admission.AdmissionController(make_cfg(global_limit=1, max_wait=60))
+
+    async def scenario():
+        ticket = await controller.acquire('graph', 1, 1)
+        start = time.monotonic()
+        with pytest.raises(admission.AdmissionError, match='Too many'):
+            await controller.acquire('graph', 2, 2)
+        assert time.monotonic() - start < 1
+        await controller.release(ticket)
+
+    run(scenario())
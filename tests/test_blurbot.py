@@ -0,0 +1,140 @@
+import asyncio
+import multiprocessing
+import time
+
+import pytest
+
+pytest.importorskip('calc')
+from discord import MemberCacheFlags
+
+import cogs
+import sharding
+from blurbot import cache_options
+from util import Config
+
+
+def test_cache_options():
+    options = cache_options(Config(loads={'member_flags': ['voice'], 'max_messages': 0,
+                                          'chunk_guilds_at_startup': False}))
+    assert options['member_cache_flags'] == MemberCacheFlags(voice=True, joined=False, interaction=False)
+    assert options['max_messages'] is None
+    assert options['chunk_guilds_at_startup'] is False
+
+def test_cache_options_rejects_unknown_member_flags():
+    with pytest.raises(ValueError, match="'online'.*voice, joined"):
+        cache_options(Config(loads={'member_flags': ['voice', 'online']}))
+
+
+class FakeStorage:
+    def __init__(self, data):
+        self.data = data
+
+    def load(self):
+        return self.data
+
+    def save(self, data):
+        pass
+
+class FakeShard:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def is_closed(self):
+        return False
+
+class FakeContext:
+    async def respond(self, *args, **kwargs):
+        pass
+
+def make_bot(monkeypatch, ipc, **cfg):
+    import blurbot
+    data = dict(admins=[], guilds=[], eggs=dict(enabled=False, data=[]), presences=dict(enabled=False, data=[]),
+                misc={}, calc={}, garf=dict(url='comic', schedules=[]), sharding=dict(health_interval=0.05))
+    data.update(cfg)
+    storage = FakeStorage(data)
+    monkeypatch.setattr(blurbot, 'create_storage', lambda label: storage)
+    # Two connected shards instead of a gateway connection
+    monkeypatch.setattr(blurbot.ShardedBlurbot, 'shards', property(lambda self: {0: FakeShard(0.05), 2: FakeShard(0.1)}))
+    return blurbot.ShardedBlurbot(shard_ids=[0, 2], shard_count=4, ipc=ipc), storage
+
+async def recv(conn, op, timeout=5):
+    """ Next message from the bot with the given op, skipping others (e.g. periodic health reports). """
+    def read():
+        deadline = time.monotonic() + timeout
+        while conn.poll(max(deadline - time.monotonic(), 0)):
+            msg = conn.recv()
+            if msg['op'] == op:
+                return msg
+        raise AssertionError('no {} message'.format(op))
+
+    # Read off the event loop, which the bot needs to send messages
+    return await asyncio.get_running_loop().run_in_executor(None, read)
+
+async def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        await asyncio.sleep(0.01)
+
+def test_ipc(monkeypatch):
+    launcher_conn, group_conn = multiprocessing.Pipe()
+
+    async def scenario():
+        bot, storage = make_bot(monkeypatch, sharding.IPCClient(group_conn, 1))
+        reloads = []
+
+        async def on_config_reload():
+            reloads.append(bot.cfg.eggs.enabled)
+
+        bot.add_listener(on_config_reload)
+        await bot.on_ready()
+
+        health = await recv(launcher_conn, 'health')
+        assert health['group'] == 1
+        assert health['shards'] == {0: dict(latency=0.05, closed=False), 2: dict(latency=0.1, closed=False)}
+
+        # Another group saved the config
+        storage.data = dict(storage.data, eggs=dict(enabled=True, data=[]))
+        launcher_conn.send({'op': 'broadcast', 'event': 'config_reload', 'group': 0})
+        await wait_for(lambda: reloads)
+        assert reloads == [True]
+
+        bot.config_changed()
+        assert await recv(launcher_conn, 'broadcast') == {'op': 'broadcast', 'event': 'config_reload', 'group': 1}
+
+        status = asyncio.ensure_future(bot.shard_status())
+        request = await recv(launcher_conn, 'status')
+        launcher_conn.send({'op': 'status', 'reply_to': request['request_id'], 'groups': ['group status']})
+        assert await status == ['group status']
+
+        # /kill shuts down the launcher, which shuts down every group
+        await cogs.Admin.kill.callback(bot.get_cog('Admin'), FakeContext())
+        assert (await recv(launcher_conn, 'shutdown'))['group'] == 1
+        assert bot.is_closed()
+
+    asyncio.run(scenario())
+
+def test_shutdown_from_launcher(monkeypatch):
+    launcher_conn, group_conn = multiprocessing.Pipe()
+
+    async def scenario():
+        bot, _ = make_bot(monkeypatch, sharding.IPCClient(group_conn, 0))
+        await bot.on_ready()
+        launcher_conn.send({'op': 'shutdown'})
+        await wait_for(bot.is_closed)
+
+    asyncio.run(scenario())
+
+def test_health_interval_default(monkeypatch):
+    launcher_conn, group_conn = multiprocessing.Pipe()
+
+    async def scenario():
+        bot, _ = make_bot(monkeypatch, sharding.IPCClient(group_conn, 0), sharding={})
+        await bot.on_ready()
+        assert (await recv(launcher_conn, 'health'))['shards']
+        await asyncio.sleep(0.05)
+        # Still reporting, waiting out the default interval
+        assert [task.done() for task in asyncio.all_tasks() if task.get_coro().__name__ == 'report_health'] == [False]
+        await bot.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import dice
+
+
+@pytest.mark.parametrize('notation, expected', [
+    ('d20', dict(count=1, low=1, high=20, keep=None, keep_lowest=False, explode=False, modifier=0)),
+    ('4d6+2', dict(count=4, high=6, modifier=2)),
+    ('2d8-3', dict(count=2, high=8, modifier=-3)),
+    ('4d6k3', dict(count=4, keep=3, keep_lowest=False)),
+    ('4d6kh3', dict(count=4, keep=3, keep_lowest=False)),
+    ('4d6kl1', dict(count=4, keep=1, keep_lowest=True)),
+    ('2d6!', dict(count=2, explode=True)),
+    (' 3D10 KH2 ! + 1 ', dict(count=3, high=10, keep=2, explode=True, modifier=1)),
+])
+def test_parse(notation, expected):
+    die = dice.Dice.parse(notation)
+    for attr, value in expected.items():
+        assert getattr(die, attr) == value
+
+@pytest.mark.parametrize('notation', ['', 'abc', '4d', 'd0', '0d6', '4d6k5', '4d6k0', '4d6+'])
+def test_parse_invalid(notation):
+    with pytest.raises(ValueError):
+        dice.Dice.parse(notation)
+
+def test_str_round_trip():
+    for notation in ('1d20', '4d6kh3', '4d6kl1', '2d6!+2', '3d8-1'):
+        assert str(dice.Dice.parse(notation)) == notation
+
+def test_bounds_and_modifier():
+    results = dice.Dice.parse('3d6+2').roll(10000)
+    assert results.shape == (10000,)
+    assert results.min() >= 5 and results.max() <= 20
+
+def test_keep_highest_and_lowest():
+    highest = dice.Dice.parse('4d6kh1').roll(20000)
+    lowest = dice.Dice.parse('4d6kl1').roll(20000)
+    assert highest.min() >= 1 and highest.max() <= 6
+    # Keeping the highest of 4 dice skews well above a single die's mean of 3.5, and lowest below
+    assert highest.mean() > 4.9
+    assert lowest.mean() < 2.1
+
+def test_explode_can_exceed_sides():
+    results = dice.Dice.parse('1d6!').roll(20000)
+    assert results.max() > 6
+    # A result that is a multiple of the sides would have exploded again
+    assert not np.any(results % 6 == 0)
+    # Expected value of an exploding d6 is 3.5 * 6/5
+    assert abs(results.mean() - 4.2) < 0.1
+
+def test_single_sided_die_does_not_explode():
+    die = dice.Dice.parse('3d1!')
+    assert not die.explode
+    assert (die.roll(10) == 3).all()
+
+def test_swapped_bounds():
+    die = dice.Dice(low=6, high=1)
+    assert (die.low, die.high) == (1, 6)
+
+def test_summary_and_histogram():
+    results = dice.Dice.parse('2d6').roll(1000)
+    assert 'Rolls: **1000**' in dice.summary(results)
+    assert dice.histogram(results, 'title').read(8) == b'\x89PNG\r\n\x1a\n'
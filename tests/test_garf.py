@@ -0,0 +1,123 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('calc')
+import cogs
+from util import Config
+
+
+class FakeStorage:
+    def __init__(self, data):
+        self.data = data
+        self.saves = 0
+        self.fail = 0
+
+    def load(self):
+        return self.data
+
+    def save(self, data):
+        if self.fail:
+            self.fail -= 1
+            raise OSError('storage is down')
+        self.saves += 1
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.posts = 0
+
+    async def send(self, file):
+        self.posts += 1
+
+def make_garf(monkeypatch, schedules, **garf):
+    fetches = []
+    monkeypatch.setattr(cogs.garfield, 'fetch', lambda url: fetches.append(url) or b'GIF89a')
+    storage = FakeStorage({'garf': dict(url='comic', **garf, **({'schedules': schedules} if schedules is not None else {}))})
+    channels = {}
+    bot = SimpleNamespace(
+        cfg=Config(storage),
+        loop=asyncio.get_running_loop(),
+        get_channel=lambda channel_id: channels.setdefault(channel_id, FakeChannel(channel_id)),
+        config_changed=lambda: None,
+    )
+    garf = cogs.Garf(bot)
+    garf.load_schedule()
+    return garf, storage, channels, fetches
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_schedule_is_ordered_by_due_time(monkeypatch):
+    async def scenario():
+        garf, *_ = make_garf(monkeypatch, [
+            dict(channel=1, interval=60, next=30),
+            dict(channel=2, interval=60, next=10),
+            dict(channel=3, interval=60, next=20),
+        ])
+        assert [cogs.heapq.heappop(garf.schedule)[1] for _ in range(3)] == [2, 3, 1]
+
+    run(scenario())
+
+def test_tick_posts_one_comic_to_every_due_channel(monkeypatch):
+    async def scenario():
+        now = time.time()
+        garf, storage, channels, fetches = make_garf(monkeypatch, [
+            dict(channel=1, interval=60, next=now - 1),
+            dict(channel=2, interval=60, next=now - 2),
+            dict(channel=3, interval=60, next=now + 60),
+        ])
+        await garf.tick()
+        assert fetches == ['comic']
+        assert {channel_id: channel.posts for channel_id, channel in channels.items()} == {1: 1, 2: 1}
+        assert storage.saves == 1
+        nexts = {entry.channel: entry.next for entry in garf.schedules}
+        assert nexts == {1: now + 59, 2: now + 58, 3: now + 60}
+        assert sorted(garf.schedule) == sorted((due, channel) for channel, due in nexts.items())
+
+    run(scenario())
+
+def test_missed_posts_are_skipped(monkeypatch):
+    async def scenario():
+        now = time.time()
+        garf, _, channels, _ = make_garf(monkeypatch, [dict(channel=1, interval=60, next=now - 60 * 3.5)])
+        await garf.tick()
+        # Posted once, next post is the first one still in the future
+        assert channels[1].posts == 1
+        assert garf.schedules[0].next == pytest.approx(now + 30)
+
+    run(scenario())
+
+def test_scheduler_survives_failed_save(monkeypatch):
+    monkeypatch.setattr(cogs.Garf, 'RETRY_DELAY', 0)
+
+    async def scenario():
+        now = time.time()
+        garf, storage, channels, _ = make_garf(monkeypatch, [
+            dict(channel=1, interval=60, next=now - 1),
+            dict(channel=2, interval=60, next=now + 0.1),
+        ])
+        storage.fail = 1
+        task = asyncio.create_task(garf.run_scheduler())
+        try:
+            await asyncio.sleep(0.5)
+        finally:
+            task.cancel()
+        assert channels[1].posts == channels[2].posts == 1
+        assert storage.saves == 1
+        # The failed save didn't drop channel 1 from the schedule
+        assert {channel for _, channel in garf.schedule} == {1, 2}
+
+    run(scenario())
+
+def test_config_without_schedules(monkeypatch):
+    async def scenario():
+        garf, *_ = make_garf(monkeypatch, None)
+        assert garf.schedule == []
+        assert not garf.remove_schedule(1)
+        assert garf.bot.cfg.garf.schedules == []
+
+    run(scenario())
@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+import pytest
+
+pytest.importorskip('calc')
+import graphing
+
+
+def test_smooth_function_uses_few_points():
+    x, y = graphing.sample(lambda x: 2 * x + 1, -10, 10)
+    assert x.size == graphing.INITIAL_POINTS
+    assert np.allclose(y, 2 * x + 1)
+
+def test_samples_are_sorted_and_within_bounds():
+    x, y = graphing.sample(np.sin, -10, 10)
+    assert np.all(np.diff(x) > 0)
+    assert x[0] == -10 and x[-1] == 10
+    assert x.size <= graphing.MAX_POINTS
+
+def test_refines_near_steep_regions():
+    x, _ = graphing.sample(lambda x: np.tanh(20 * x), -10, 10)
+    near = np.count_nonzero(np.abs(x) < 0.5)
+    far = np.count_nonzero(np.abs(x) > 9)
+    assert near > 4 * far
+
+def test_breaks_line_at_discontinuity():
+    with np.errstate(divide='ignore'):
+        x, y = graphing.sample(lambda x: 1 / x, -10, 10)
+    breaks = x[np.isnan(y)]
+    assert breaks.size >= 1
+    assert np.all(np.abs(breaks) < 0.1)
+
+def test_continuous_function_is_not_broken():
+    _, y = graphing.sample(lambda x: x ** 3, -10, 10)
+    assert not np.isnan(y).any()
+
+def test_vectorize_scalar_function():
+    func = graphing.vectorize(lambda x: math.log(x))
+    y = func(np.array([-1.0, 1.0, math.e]))
+    assert np.isnan(y[0])
+    assert np.allclose(y[1:], [0, 1])
+
+def test_vectorize_array_function_is_used_directly():
+    calls = []
+    def func(x):
+        calls.append(x)
+        return x * 2
+    graphing.vectorize(func)(np.arange(10.0))
+    assert calls[-1].shape == (10,)
+
+def test_ylim_ignores_asymptotes():
+    with np.errstate(divide='ignore'):
+        y = np.tan(np.linspace(-10, 10, graphing.INITIAL_POINTS))
+    low, high = graphing._ylim(y, None, None)
+    assert -20 < low < 0 < high < 20
+    assert graphing._ylim(y, 5, -5) == (-5, 5)
@@ -0,0 +1,44 @@
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+import imaging
+
+
+def line_image():
+    img = Image.new('RGBA', (400, 300), 'white')
+    draw = ImageDraw.Draw(img)
+    for i in range(0, 400, 20):
+        draw.line((i, 0, 400 - i, 300), fill=(30, 100, 200, 255), width=2)
+    return img
+
+def test_encode_image_is_valid_png_and_smaller_than_default():
+    img = line_image()
+    default = BytesIO()
+    img.save(default, format='png')
+
+    bio = imaging.encode_image(img, 'graph')
+    decoded = Image.open(bio)
+    assert decoded.format == 'PNG'
+    assert decoded.size == img.size
+    assert bio.getbuffer().nbytes < default.tell()
+
+def test_stats_measure_savings_against_default_png():
+    stats = imaging.EncodeStats()
+    stats.record('graph', 100, 0.01, baseline_bytes=250)
+    for _ in range(3):
+        stats.record('graph', 100, 0.01)
+    # Ratio from the sampled image is extrapolated to all 400 bytes sent
+    assert stats.saved_bytes('graph') == 600
+    assert '~0.6 KiB saved vs default png' in str(stats)
+
+def test_baseline_is_sampled():
+    stats = imaging.EncodeStats()
+    wanted = []
+    for _ in range(2 * stats.BASELINE_EVERY):
+        wanted.append(stats.wants_baseline('x'))
+        stats.record('x', 1, 0.0)
+    assert wanted.count(True) == 2
+
+def test_wrap_passes_data_through():
+    assert imaging.wrap(b'GIF89a', 'garf').read() == b'GIF89a'
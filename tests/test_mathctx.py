@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('calc')
+import mathctx
+from util import Config
+
+
+class MemoryStorage:
+    docs = {}
+    loads = []
+
+    def __init__(self, key):
+        self.key = key
+
+    def load(self):
+        self.loads.append(self.key)
+        if self.key not in self.docs:
+            raise FileNotFoundError(self.key)
+        return self.docs[self.key]
+
+    def save(self, data):
+        self.docs[self.key] = dict(data)
+
+@pytest.fixture(autouse=True)
+def storage(monkeypatch):
+    MemoryStorage.docs = {}
+    MemoryStorage.loads = []
+    monkeypatch.setattr(mathctx, 'create_storage', lambda label, key=None: MemoryStorage(key))
+    monkeypatch.setattr(mathctx.calc, 'create_default_context', lambda: {}, raising=False)
+    monkeypatch.setattr(mathctx.calc, 'load_contexts', lambda ctx, contexts: ctx.update(loaded=contexts), raising=False)
+    monkeypatch.setattr(mathctx.calc, 'dump_contexts', lambda ctx: ctx.get('loaded'), raising=False)
+    return MemoryStorage
+
+def make_cache(**calc):
+    return mathctx.ContextCache(Config(loads={'calc': calc}))
+
+
+def test_loads_lazily_and_caches(storage):
+    storage.docs[1] = {'contexts': ['f']}
+    cache = make_cache()
+    assert storage.loads == []
+    assert cache.get(1).ctx['loaded'] == ['f']
+    cache.get(1)
+    assert storage.loads == [1]
+
+def test_keys_without_contexts_start_from_shared_contexts(storage):
+    storage.docs[None] = {'contexts': ['shared']}
+    storage.docs[2] = {'contexts': ['own']}
+    cache = make_cache()
+    assert cache.get(1).ctx['loaded'] == ['shared']
+    assert cache.get('dm3').ctx['loaded'] == ['shared']
+    assert cache.get(2).ctx['loaded'] == ['own']
+    # The shared document is only read once
+    assert storage.loads.count(None) == 1
+
+def test_default_context_without_shared_contexts():
+    assert make_cache().get(1).ctx['loaded'] == [{}]
+
+def test_evicts_least_recently_used_past_cap():
+    cache = make_cache(max_contexts=2)
+    cache.get(1)
+    cache.get(2)
+    cache.get(1)
+    cache.get(3)
+    assert list(cache.contexts) == [1, 3]
+
+def test_evicts_idle_contexts():
+    cache = make_cache(context_idle_timeout=0.05)
+    cache.get(1)
+    time.sleep(0.1)
+    cache.evict()
+    assert len(cache) == 0
+
+def test_loads_outside_the_cache_lock(storage):
+    started = threading.Event()
+    release = threading.Event()
+    load = MemoryStorage.load
+
+    def slow_load(self):
+        if self.key == 1:
+            started.set()
+            release.wait(5)
+        return load(self)
+
+    storage.load = slow_load
+    cache = make_cache()
+    thread = threading.Thread(target=cache.get, args=(1,))
+    thread.start()
+    started.wait(5)
+    # Another guild loads while guild 1 is still loading
+    cache.get(2)
+    assert 1 not in cache.contexts
+    release.set()
+    thread.join(5)
+    assert set(cache.contexts) == {1, 2}
+    storage.load = load
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+import sharding
+
+FACTORY = 'sharding.stub:StubBot'
+
+
+@pytest.fixture
+def launcher(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharding, 'RESTART_DELAY', 0)
+    launchers = []
+
+    def make(processes):
+        launcher = sharding.Launcher(str(tmp_path), 2, processes, factory=FACTORY)
+        launcher.running = True
+        launchers.append(launcher)
+        return launcher
+
+    yield make
+    for launcher in launchers:
+        launcher.stop()
+
+def poll_until(launcher, condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        launcher.poll(timeout=0.1)
+
+def test_shards_are_split_between_groups():
+    launcher = sharding.Launcher('', 5, 2, factory=FACTORY)
+    assert [group.shard_ids for group in launcher.groups] == [[0, 2, 4], [1, 3]]
+    with pytest.raises(ValueError):
+        sharding.Launcher('', 2, 3, factory=FACTORY)
+
+def test_health_broadcast_and_restart(launcher, tmp_path):
+    (tmp_path / 'crash-1').touch()
+    launcher = launcher(2)
+    for group in launcher.groups:
+        launcher.start_group(group)
+
+    poll_until(launcher, lambda: all(group.health for group in launcher.groups))
+    assert launcher.groups[0].health['shards'] == {0: dict(latency=0.0, closed=False)}
+
+    # Group 1 crashes after receiving group 0's broadcast and is restarted
+    poll_until(launcher, lambda: launcher.groups[1].restarts == 1 and launcher.groups[1].health)
+    assert 'started from 0' in (tmp_path / 'received-1').read_text()
+    assert 'started from 1' in (tmp_path / 'received-0').read_text()
+    assert launcher.groups[0].restarts == 0
+    assert all(group['alive'] for group in launcher.status())
+
+def test_clean_exit_stops_launcher(launcher, tmp_path):
+    (tmp_path / 'exit-0').touch()
+    launcher = launcher(1)
+    launcher.start_group(launcher.groups[0])
+    poll_until(launcher, lambda: not launcher.running)
+    assert launcher.groups[0].restarts == 0
+
+def test_shutdown_stops_every_group(launcher):
+    launcher = launcher(2)
+    for group in launcher.groups:
+        launcher.start_group(group)
+    poll_until(launcher, lambda: all(group.health for group in launcher.groups))
+
+    launcher.handle(launcher.groups[0], {'op': 'shutdown', 'group': 0})
+    assert not launcher.running
+    launcher.stop()
+    assert [group.process.exitcode for group in launcher.groups] == [0, 0]
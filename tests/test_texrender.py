@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+import texrender
+
+
+class FakeWorker:
+    def __init__(self, workdir, jobname):
+        self.killed = False
+
+    def cleanup(self):
+        self.killed = True
+
+def test_failed_format_build_removes_workdir(monkeypatch, tmp_path):
+    workdir = tmp_path / 'tex'
+    monkeypatch.setattr(texrender.tempfile, 'mkdtemp', lambda prefix: str(workdir.mkdir() or workdir))
+
+    def fail(self):
+        raise texrender.TexError('no pdflatex')
+
+    monkeypatch.setattr(texrender.TexRenderer, '_build_format', fail)
+    with pytest.raises(texrender.TexError):
+        texrender.TexRenderer()
+    assert not os.path.exists(workdir)
+
+def test_failed_spawn_kills_started_workers(monkeypatch):
+    started = []
+
+    def spawn(self):
+        if len(started) == 2:
+            raise OSError('too many processes')
+        started.append(FakeWorker(self.workdir, 'job'))
+        return started[-1]
+
+    monkeypatch.setattr(texrender.TexRenderer, '_build_format', lambda self: None)
+    monkeypatch.setattr(texrender.TexRenderer, '_spawn', spawn)
+    with pytest.raises(OSError):
+        texrender.TexRenderer(workers=3)
+    assert [worker.killed for worker in started] == [True, True]
@@ -0,0 +1,59 @@
+import random
+
+import textfx
+
+OLD_SUBSTITUTION = {'r': 'w', 'l': 'w', 'R': 'W', 'L': 'W', 'no': 'nu', 'has': 'haz',
+                    'have': 'haz', 'you': 'uu', ' the ': ' da ', 'The ': ' Da '}
+
+
+def old_substitute(content):
+    for key, replacement in OLD_SUBSTITUTION.items():
+        content = content.replace(key, replacement)
+    return content
+
+
+def test_owo_matches_sequential_replace():
+    rng = random.Random(0)
+    alphabet = 'rlRLnohasvyuteTx '
+    for _ in range(20000):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        assert textfx.owo.substitute(text) == old_substitute(text)
+
+def test_owo_adds_prefix_and_suffix():
+    result = textfx.owo('hello')
+    assert any(result.startswith(prefix + ' hewwo ') for prefix in textfx.owo.prefixes)
+    assert any(result.endswith(' hewwo ' + suffix) for suffix in textfx.owo.suffixes)
+
+def test_single_character_transform():
+    assert textfx.Transform({'a': '4', 'e': '3'})('leet speak') == 'l33t sp34k'
+
+def test_substitutions_apply_in_order():
+    assert textfx.Transform({'a': '1', 'ab': '2'})('abab a') == '1b1b 1'
+    assert textfx.Transform({'ab': '2', 'a': '1'})('abab a') == '22 1'
+
+def test_load_transforms_from_config():
+    transforms = textfx.load_transforms({'leet': {'substitutions': {'e': '3'}}})
+    assert set(transforms) == {'owo', 'leet'}
+    assert transforms['leet']('eek') == '33k'
+
+def test_spongemock_empty():
+    assert textfx.spongemock('') == ''
+
+def test_spongemock_short():
+    text = 'hello there'
+    result = textfx.spongemock(text)
+    assert len(result) == len(text)
+    assert result.lower() == text
+
+def test_spongemock_case_changes_length():
+    assert textfx.spongemock('straße').lower() in ('straße', 'strasse')
+    # Long enough for the NumPy path
+    assert set(textfx.spongemock('straße ' * 50).lower().split()) <= {'straße', 'strasse'}
+
+def test_spongemock_long():
+    text = 'abcdefghij' * 400
+    result = textfx.spongemock(text)
+    assert len(result) == len(text)
+    assert result.lower() == text
+    # With 4000 letters, both cases show up
+    assert any(c.isupper() for c in result) and any(c.islower() for c in result)
@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+from util import Config, EggResponse, compile_eggs
+
+
+def eggs_config(eggs):
+    return Config(loads={'data': eggs}).data
+
+def test_literal_response():
+    response = EggResponse('hello')
+    assert not response.is_eval
+    assert response.render(None) == 'hello'
+
+def test_eval_response():
+    response = EggResponse('#eval msg.content.upper()')
+    assert response.is_eval
+    assert response.render(SimpleNamespace(content='hi')) == 'HI'
+
+def test_eval_prefix_only_strips_prefix():
+    # lstrip('#eval ') used to strip the leading 'e' and 'v' of the expression too
+    assert EggResponse('#eval "eve"').render(None) == 'eve'
+
+def test_eval_has_no_builtins():
+    response = EggResponse("#eval open('/etc/passwd')")
+    try:
+        response.render(None)
+    except TypeError:
+        pass
+    else:
+        raise AssertionError('builtins should not be available')
+
+def test_compile_eggs_skips_only_broken_responses(capsys):
+    eggs = compile_eggs(eggs_config([
+        {'regex': 'hi', 'responses': ['hello', '#eval (', '#eval 1 + 1']},
+    ]))
+    assert len(eggs) == 1
+    assert [r.source for r in eggs[0].responses] == ['hello', '#eval 1 + 1']
+    assert 'broken response' in capsys.readouterr().err
+
+def test_compile_eggs_skips_broken_regex_and_empty_eggs(capsys):
+    eggs = compile_eggs(eggs_config([
+        {'regex': '(', 'responses': ['hello']},
+        {'regex': 'a', 'responses': ['#eval )']},
+        {'regex': 'b+', 'responses': ['bee']},
+    ]))
+    assert len(eggs) == 1
+    assert eggs[0].regex.fullmatch('bbb')
+    err = capsys.readouterr().err
+    assert "broken egg '('" in err
+    assert "egg 'a': no working responses" in err
@@ -0,0 +1,175 @@
+import atexit
+import itertools
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from io import BytesIO
+
+from PIL import Image
+
+PREAMBLE = r"""\documentclass[preview,border=2pt,varwidth]{standalone}
+\usepackage{amsmath}
+\usepackage{xcolor}
+"""
+
+DOCUMENT = r"""\begin{document}
+\color{%s}
+$\displaystyle %s$
+\end{document}
+"""
+
+
+class TexError(Exception):
+    pass
+
+class TexWorker:
+    """
+    A pdflatex process that has already started and is waiting at its first prompt for the
+    name of the file to typeset. Each worker renders one document.
+    """
+    def __init__(self, workdir, jobname):
+        self.workdir = workdir
+        self.jobname = jobname
+        self.proc = subprocess.Popen(
+            ['pdflatex', '-fmt=preamble', '-interaction=nonstopmode', '-halt-on-error',
+             '-jobname=' + jobname],
+            cwd=workdir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT
+        )
+
+    @property
+    def alive(self):
+        return self.proc.poll() is None
+
+    def path(self, ext):
+        return os.path.join(self.workdir, self.jobname + ext)
+
+    def typeset(self, document, timeout):
+        """ Typeset a document and return the path to the resulting pdf. """
+        with open(self.path('.tex'), 'w') as f:
+            f.write(document)
+        try:
+            output, _ = self.proc.communicate((self.jobname + '.tex\n').encode(), timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.kill()
+            raise TimeoutError('LaTeX rendering took too long.')
+
+        if self.proc.returncode != 0 or not os.path.exists(self.path('.pdf')):
+            raise TexError(_tex_error(output.decode(errors='replace')))
+        return self.path('.pdf')
+
+    def kill(self):
+        if self.alive:
+            self.proc.kill()
+            self.proc.wait()
+
+    def cleanup(self):
+        self.kill()
+        for ext in ('.tex', '.pdf', '.log', '.aux', '.png'):
+            try:
+                os.remove(self.path(ext))
+            except FileNotFoundError:
+                pass
+
+class TexRenderer:
+    """
+    Renders LaTeX to images using a preamble precompiled into a format file, and a small pool
+    of pdflatex processes that are started ahead of time. Workers are single use, so each one
+    is replaced as soon as it is taken, and dead workers are discarded and restarted.
+    """
+    def __init__(self, workers=2, timeout=10):
+        self.workers = workers
+        self.timeout = timeout
+        self.workdir = tempfile.mkdtemp(prefix='blurbot-tex-')
+        self._jobs = itertools.count()
+        self._lock = threading.Lock()
+        self._idle = []
+
+        try:
+            self._build_format()
+            with self._lock:
+                for _ in range(workers):
+                    self._idle.append(self._spawn())
+        except BaseException:
+            # Don't leave the work directory or already started workers behind
+            self.close()
+            raise
+        atexit.register(self.close)
+
+    def _build_format(self):
+        with open(os.path.join(self.workdir, 'preamble.tex'), 'w') as f:
+            f.write(PREAMBLE)
+        result = subprocess.run(
+            ['pdflatex', '-ini', '-interaction=nonstopmode', '-halt-on-error', '-jobname=preamble',
+             r'&pdflatex preamble.tex\dump'],
+            cwd=self.workdir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            timeout=self.timeout * 10
+        )
+        if not os.path.exists(os.path.join(self.workdir, 'preamble.fmt')):
+            raise TexError('Failed to build LaTeX format:\n' + _tex_error(result.stdout.decode(errors='replace')))
+
+    def _spawn(self):
+        return TexWorker(self.workdir, 'job{}'.format(next(self._jobs)))
+
+    def _take(self):
+        """ Take a live worker from the pool and start its replacement. """
+        with self._lock:
+            worker = None
+            while self._idle and worker is None:
+                worker = self._idle.pop()
+                if not worker.alive:
+                    # Crashed while idle
+                    worker.cleanup()
+                    worker = None
+            self._idle.append(self._spawn())
+        return worker or self._spawn()
+
+    def render(self, tex, dpi=200, color='white'):
+        """ Render a LaTeX math expression to a PIL image. """
+        worker = self._take()
+        try:
+            pdf = worker.typeset(DOCUMENT % (color, tex), self.timeout)
+            png = self._convert(pdf, worker.path(''), dpi)
+            with open(png, 'rb') as f:
+                img = Image.open(BytesIO(f.read()))
+                img.load()
+            return img
+        finally:
+            worker.cleanup()
+
+    def _convert(self, pdf, out_root, dpi):
+        try:
+            subprocess.run(
+                ['pdftocairo', '-png', '-singlefile', '-transp', '-r', str(dpi), pdf, out_root],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                timeout=self.timeout,
+                check=True
+            )
+        except subprocess.TimeoutExpired:
+            raise TimeoutError('LaTeX image conversion took too long.')
+        except subprocess.CalledProcessError as e:
+            raise TexError('Image conversion failed: ' + e.stderr.decode(errors='replace').strip())
+        return out_root + '.png'
+
+    def close(self):
+        with self._lock:
+            for worker in self._idle:
+                worker.cleanup()
+            self._idle.clear()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def _tex_error(log):
+    """ Extract the first error message from TeX output. """
+    lines = log.splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith('!'):
+            return '\n'.join(lines[i:i+3])
+    return log[-500:]
@@ -0,0 +1,79 @@
+import random
+
+import numpy as np
+
+# Shorter text is spongemocked in plain Python, which beats NumPy's fixed overhead
+SPONGEMOCK_NUMPY_MIN_LENGTH = 100
+
+
+class Transform:
+    """ Text transform compiled once from a substitution table and optional prefix/suffix lists. """
+    def __init__(self, substitutions=None, prefixes=None, suffixes=None):
+        self.substitutions = dict(substitutions or {})
+        self.prefixes = list(prefixes or [])
+        self.suffixes = list(suffixes or [])
+
+        self._table = None
+        self._replacements = tuple(self.substitutions.items())
+        if self.substitutions and all(len(key) == 1 for key in self.substitutions):
+            # Single character substitutions can be done in one pass with str.translate
+            self._table = str.maketrans(self.substitutions)
+
+    def substitute(self, text):
+        if self._table is not None:
+            return text.translate(self._table)
+        # Multi-character substitutions are applied in order. A chain of str.replace calls runs
+        # in C and benchmarks several times faster than a single regex alternation with a
+        # Python callback per match.
+        for key, replacement in self._replacements:
+            text = text.replace(key, replacement)
+        return text
+
+    def __call__(self, text):
+        parts = [self.substitute(text)]
+        if self.prefixes:
+            parts.insert(0, random.choice(self.prefixes))
+        if self.suffixes:
+            parts.append(random.choice(self.suffixes))
+        return ' '.join(parts)
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(cfg.get('substitutions'), cfg.get('prefixes'), cfg.get('suffixes'))
+
+
+owo = Transform(
+    substitutions={'r': 'w', 'l': 'w', 'R': 'W', 'L': 'W', 'no': 'nu', 'has': 'haz',
+                   'have': 'haz', 'you': 'uu', ' the ': ' da ', 'The ': ' Da '},
+    prefixes=['<3', 'H-hewwo??', 'HIIII!', 'Haiiii!', 'Huohhhh.', 'OWO', 'OwO', 'UwU',
+              '88w88', 'H-h-hi'],
+    suffixes=[':3', 'UwU', 'ʕʘ‿ʘʔ', '>_>', '^_^', '.', 'Huoh.', '^-^', ';_;', 'xD',
+              'x3', ':D', ':P', ';3', 'XDDD', 'fwendo', 'ㅇㅅㅇ', '(人◕ω◕)', '（＾ｖ＾）',
+              'Sigh.', '._.', '>_<', 'xD xD xD', ':D :D :D']
+)
+
+
+def load_transforms(cfg=None):
+    """ Build the transform table from the builtin transforms and any defined in config. """
+    transforms = {'owo': owo}
+    if cfg:
+        for name, transform_cfg in cfg.items():
+            transforms[name] = Transform.from_config(transform_cfg)
+    return transforms
+
+
+def spongemock(text):
+    """ Randomly capitalize letters using a single random mask for the whole string. """
+    if len(text) < SPONGEMOCK_NUMPY_MIN_LENGTH:
+        rand = random.random
+        return ''.join([c.upper() if rand() < 0.5 else c.lower() for c in text])
+
+    upper, lower = text.upper(), text.lower()
+    mask = np.random.randint(0, 2, len(text), dtype=bool)
+    if len(upper) == len(lower) == len(text):
+        # Pick each character from the upper or lower case string as an array of code points
+        upper = np.frombuffer(upper.encode('utf-32-le'), dtype=np.uint32)
+        lower = np.frombuffer(lower.encode('utf-32-le'), dtype=np.uint32)
+        return np.where(mask, upper, lower).tobytes().decode('utf-32-le')
+    # Some characters change length when their case changes (e.g. ß -> SS)
+    return ''.join(c.upper() if bit else c.lower() for c, bit in zip(text, mask))
@@ -1,6 +1,10 @@
 import json
 import os
 import random
+import re
+import sys
+
+import stopit
 from pymongo import MongoClient
 
 from discord import Message, Activity, ActivityType
@@ -177,30 +181,80 @@ class MongoStorage:
     def __str__(self):
         return '<MongoStorage {} @{}>'.format(self._id, self.collection.name)
 
-def create_storage(label):
+def create_storage(label, key=None):
+    """ Create the storage for a label. A key selects a separate document under the same label. """
     storage_type = os.environ['BLURBOT_STORAGE_INTERFACE']
     if storage_type == 'file':
-        return FileStorage(os.environ['FILEPATH_' + label.upper()])
+        fp = os.environ['FILEPATH_' + label.upper()]
+        if key is not None:
+            root, ext = os.path.splitext(fp)
+            fp = '{}.{}{}'.format(root, key, ext)
+        return FileStorage(fp)
     elif storage_type == 'heroku':
         return HerokuConfigVarsStorage(
-            os.environ['HEROKU_VARNAME_' + label.upper()],
+            os.environ['HEROKU_VARNAME_' + label.upper()] + ('' if key is None else '_{}'.format(key)),
             os.environ['HEROKU_SECRET']
         )
     elif storage_type == 'mongo':
         return MongoStorage(
             os.environ['MONGO_USER'],
             os.environ['MONGO_SECRET'],
-            label
+            label if key is None else '{}:{}'.format(label, key)
         )
     else:
         raise ValueError('Invalid storage interface: ' + storage_type)
 
 
-def render_egg(egg, msg:Message):
-    if egg.startswith('#eval '):
-        egg = egg.lstrip('#eval ')
-        egg = eval(egg, {'__builtins__': None}, {'msg': msg, 'rand': random.random})
-    return egg
+class EggResponse:
+    """ An egg response, either literal text or an expression prefixed with #eval that is compiled once. """
+    EVAL_PREFIX = '#eval '
+
+    def __init__(self, source:str):
+        self.source = source
+        self.code = None
+        if source.startswith(self.EVAL_PREFIX):
+            self.code = compile(source[len(self.EVAL_PREFIX):], '<egg>', 'eval')
+
+    @property
+    def is_eval(self):
+        return self.code is not None
+
+    def render(self, msg:Message, timeout=1):
+        if self.code is None:
+            return self.source
+        with stopit.ThreadingTimeout(timeout) as timer:
+            result = eval(self.code, {'__builtins__': None}, {'msg': msg, 'rand': random.random})
+        if timer.state == timer.TIMED_OUT:
+            raise TimeoutError('Egg took too long: {}'.format(self.source))
+        return result
+
+class Egg:
+    def __init__(self, regex, responses):
+        self.regex = re.compile(regex)
+        self.responses = responses
+
+def compile_eggs(data):
+    """
+    Compile egg regexes and responses. Broken responses are reported and skipped, as are eggs
+    with a broken regex or no working responses.
+    """
+    eggs = []
+    for egg in data:
+        responses = []
+        for source in egg.responses:
+            try:
+                responses.append(EggResponse(source))
+            except (SyntaxError, ValueError) as e:
+                print('Ignoring broken response {!r} of egg {!r}: {}: {}'
+                      .format(source, egg.regex, type(e).__name__, e), file=sys.stderr)
+        if not responses:
+            print('Ignoring egg {!r}: no working responses'.format(egg.regex), file=sys.stderr)
+            continue
+        try:
+            eggs.append(Egg(egg.regex, responses))
+        except re.error as e:
+            print('Ignoring broken egg {!r}: {}: {}'.format(egg.regex, type(e).__name__, e), file=sys.stderr)
+    return eggs
 
 def get_presence(presence):
     return Activity(type=ActivityType[presence.activity], name=presence.name)